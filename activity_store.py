@@ -0,0 +1,246 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Iterable, Iterator
+
+import pandas
+
+# Bump when the table layout changes, the store is then rebuilt by a full sync
+SCHEMA_VERSION = 3
+
+# Only the fields the screens use are kept, with the dtypes they are loaded as
+DTYPES = {
+    "id": "int64",
+    "start_date": "int64",
+    "start_date_local": "int64",
+    "type": "category",
+    "sport_type": "category",
+    "distance": "float32",
+    "moving_time": "float32",
+    "elapsed_time": "float32",
+    "total_elevation_gain": "float32",
+}
+# Stored but only read on demand by the route map, so the encoded routes stay out of the loaded table
+COLUMNS = [*DTYPES, "summary_polyline"]
+
+# Per local day and activity type totals, kept in step with the activities table by triggers
+DAILY_TOTALS_DDL = (
+    "CREATE TABLE daily_totals (day INTEGER NOT NULL, type TEXT NOT NULL, count INTEGER NOT NULL, "
+    "distance REAL NOT NULL, moving_time REAL NOT NULL, elapsed_time REAL NOT NULL, elevation_gain REAL NOT NULL, "
+    "PRIMARY KEY (day, type))",
+    """CREATE TRIGGER activities_insert AFTER INSERT ON activities BEGIN
+        INSERT INTO daily_totals VALUES (NEW.start_date_local / 86400, COALESCE(NEW.type, ''), 1,
+            COALESCE(NEW.distance, 0), COALESCE(NEW.moving_time, 0), COALESCE(NEW.elapsed_time, 0),
+            COALESCE(NEW.total_elevation_gain, 0))
+        ON CONFLICT (day, type) DO UPDATE SET count = count + 1, distance = distance + excluded.distance,
+            moving_time = moving_time + excluded.moving_time, elapsed_time = elapsed_time + excluded.elapsed_time,
+            elevation_gain = elevation_gain + excluded.elevation_gain;
+    END""",
+    """CREATE TRIGGER activities_delete AFTER DELETE ON activities BEGIN
+        UPDATE daily_totals SET count = count - 1, distance = distance - COALESCE(OLD.distance, 0),
+            moving_time = moving_time - COALESCE(OLD.moving_time, 0),
+            elapsed_time = elapsed_time - COALESCE(OLD.elapsed_time, 0),
+            elevation_gain = elevation_gain - COALESCE(OLD.total_elevation_gain, 0)
+        WHERE day = OLD.start_date_local / 86400 AND type = COALESCE(OLD.type, '');
+        DELETE FROM daily_totals WHERE day = OLD.start_date_local / 86400 AND count = 0;
+    END""",
+)
+
+
+def to_epoch(timestamp: str) -> int:
+    """
+    Converts a Strava ISO 8601 timestamp such as 2025-03-01T08:00:00Z to epoch seconds
+    """
+    return int(datetime.fromisoformat(timestamp.replace("Z", "+00:00")).timestamp())
+
+
+def project(activities: Iterable[dict]) -> Iterator[tuple]:
+    """
+    Yields each raw Strava activity reduced to the stored fields, in COLUMNS order
+    """
+    for activity in activities:
+        yield (
+            activity["id"],
+            to_epoch(activity["start_date"]),
+            # start_date_local is the wall-clock time, Strava just marks it with a Z
+            to_epoch(activity["start_date_local"]),
+            activity.get("type"),
+            activity.get("sport_type"),
+            activity.get("distance", 0),
+            activity.get("moving_time", 0),
+            activity.get("elapsed_time", 0),
+            activity.get("total_elevation_gain", 0),
+            (activity.get("map") or {}).get("summary_polyline") or None,
+        )
+
+
+class ActivityStore:
+    """
+    Local SQLite copy of the athlete's full Strava activity history
+    """
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Renders run on worker threads, so the connection is shared and calls are serialised
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.RLock()
+        # INSERT OR REPLACE only fires the delete trigger for the replaced row with recursive triggers on
+        self._conn.execute("PRAGMA recursive_triggers = ON")
+        with self._conn:
+            if self._conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                self._conn.execute("DROP TABLE IF EXISTS activities")
+                self._conn.execute("DROP TABLE IF EXISTS daily_totals")
+                self._conn.execute("DROP TABLE IF EXISTS sync_state")
+                self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS activities (id INTEGER PRIMARY KEY, start_date INTEGER NOT NULL, "
+                "start_date_local INTEGER NOT NULL, type TEXT, sport_type TEXT, distance REAL, moving_time REAL, "
+                "elapsed_time REAL, total_elevation_gain REAL, summary_polyline TEXT)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS activities_start_date ON activities (start_date)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            # An activity's zone distribution never changes once recorded, so it outlives schema rebuilds.
+            # expires_at is set for entries that are only known to be unavailable for now
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS heart_rate_zones (activity_id INTEGER PRIMARY KEY, buckets TEXT NOT NULL, "
+                "expires_at INTEGER)"
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(heart_rate_zones)")}
+            if "expires_at" not in columns:
+                self._conn.execute("ALTER TABLE heart_rate_zones ADD COLUMN expires_at INTEGER")
+        if not self._conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'daily_totals'").fetchone():
+            self._create_daily_totals()
+
+    def _create_daily_totals(self) -> None:
+        """
+        Adds the daily totals and their triggers to a store that predates them, backfilled from the stored activities
+        """
+        with self._conn:
+            self._conn.execute("DROP TRIGGER IF EXISTS activities_insert")
+            self._conn.execute("DROP TRIGGER IF EXISTS activities_delete")
+            for statement in DAILY_TOTALS_DDL:
+                self._conn.execute(statement)
+            self._conn.execute(
+                "INSERT INTO daily_totals SELECT start_date_local / 86400, COALESCE(type, ''), COUNT(*), "
+                "TOTAL(distance), TOTAL(moving_time), TOTAL(elapsed_time), TOTAL(total_elevation_gain) "
+                "FROM activities GROUP BY 1, 2"
+            )
+
+    def upsert(self, activities: Iterable[dict]) -> None:
+        """
+        Inserts new activities and replaces the ones already stored with the same id
+        """
+        placeholders = ", ".join("?" * len(COLUMNS))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO activities ({', '.join(COLUMNS)}) VALUES ({placeholders})",
+                project(activities),
+            )
+
+    def delete(self, activity_id: int) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM activities WHERE id = ?", (activity_id,))
+
+    def last_start_date(self) -> int:
+        """
+        Returns the epoch timestamp of the most recent stored activity, 0 if the store is empty
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT MAX(start_date) FROM activities").fetchone()
+        return row[0] or 0
+
+    def sync_cursor(self) -> int:
+        """
+        Returns the start date up to which every activity has been synced. Stores from before the cursor was kept
+        use the latest stored activity
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM sync_state WHERE key = 'cursor'").fetchone()
+        return row[0] if row else self.last_start_date()
+
+    def set_sync_cursor(self, start_date: int) -> None:
+        """
+        Moves the cursor forward once every page up to start_date has been stored. Kept apart from the latest
+        stored activity, which pages fetched out of order or webhook events can move past activities still missing
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO sync_state VALUES ('cursor', ?) ON CONFLICT (key) DO UPDATE SET value = MAX(value, excluded.value)",
+                (start_date,),
+            )
+
+    def load(self) -> pandas.DataFrame:
+        """
+        Returns every stored activity, latest first, as a typed table with naive local start_date_local
+        and UTC start_date
+        """
+        with self._lock:
+            activities = pandas.read_sql_query(
+                f"SELECT {', '.join(DTYPES)} FROM activities ORDER BY start_date DESC", self._conn, dtype=DTYPES
+            )
+        activities["start_date"] = pandas.to_datetime(activities["start_date"], unit="s", utc=True)
+        activities["start_date_local"] = pandas.to_datetime(activities["start_date_local"], unit="s")
+        return activities
+
+    def recent_routes(self, n: int) -> pandas.DataFrame:
+        """
+        Returns the id, local start date, type, distance and encoded route of the latest n activities that have
+        a route, latest first
+        """
+        with self._lock:
+            routes = pandas.read_sql_query(
+                "SELECT id, start_date_local, type, distance, summary_polyline FROM activities "
+                "WHERE summary_polyline IS NOT NULL ORDER BY start_date DESC LIMIT ?", self._conn, params=(n,)
+            )
+        routes["start_date_local"] = pandas.to_datetime(routes["start_date_local"], unit="s")
+        return routes
+
+    def missing_zones(self, activity_ids: list[int]) -> list[int]:
+        """
+        Returns the activities whose heart rate zones haven't been stored yet or have expired, in the given order
+        """
+        with self._lock:
+            stored = {row[0] for row in self._conn.execute(
+                f"SELECT activity_id FROM heart_rate_zones WHERE activity_id IN ({', '.join('?' * len(activity_ids))}) "
+                f"AND (expires_at IS NULL OR expires_at > ?)",
+                [*activity_ids, int(time.time())],
+            )}
+        return [activity_id for activity_id in activity_ids if activity_id not in stored]
+
+    def add_zones(self, activity_id: int, buckets: list[dict], expires_at: int | None=None) -> None:
+        """
+        Stores the activity's heart rate zone buckets (min, max and time in seconds). An empty list records that
+        the activity has none, so it isn't fetched again, or with expires_at (epoch seconds) not until then
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO heart_rate_zones VALUES (?, ?, ?)",
+                (activity_id, json.dumps([[bucket["min"], bucket["max"], bucket["time"]] for bucket in buckets]),
+                 expires_at),
+            )
+
+    def zones(self, activity_ids: list[int]) -> dict[int, list[dict]]:
+        """
+        Returns the stored heart rate zone buckets of the given activities
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT activity_id, buckets FROM heart_rate_zones "
+                f"WHERE activity_id IN ({', '.join('?' * len(activity_ids))})",
+                activity_ids,
+            ).fetchall()
+        return {activity_id: [{"min": low, "max": high, "time": time} for low, high, time in json.loads(buckets)]
+                for activity_id, buckets in rows}
+
+    def daily_totals(self) -> pandas.DataFrame:
+        """
+        Returns the activity count, distance, moving and elapsed time and elevation gain per local day
+        (days since the epoch) and activity type
+        """
+        with self._lock:
+            return pandas.read_sql_query("SELECT * FROM daily_totals ORDER BY day", self._conn)
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,58 @@
+from datetime import date, timedelta
+
+import numpy
+import pandas
+
+# Activity types counted as each sport, shared with the weekly charts so both agree
+SPORT_GROUPS = {
+    "run": ["Run"],
+    "ride": ["Ride", "VirtualRide"],
+}
+METRICS = ("count", "distance", "moving_time", "elapsed_time", "elevation_gain")
+EPOCH = date(1970, 1, 1)
+
+
+class AggregateIndex:
+    """
+    Running totals per sport group and local day, built from the activity store's daily totals.
+    The totals over any range of days are the difference of two prefix sums, so every window is O(1)
+    """
+    def __init__(self, daily_totals: pandas.DataFrame, groups: dict[str, list[str]]=SPORT_GROUPS):
+        days = daily_totals["day"].to_numpy(dtype="int64")
+        self._first_day = int(days.min()) if len(days) else 0
+        self._n_days = n_days = int(days.max()) - self._first_day + 1 if len(days) else 0
+        self._prefix = {}
+        for group, types in groups.items():
+            rows = daily_totals["type"].isin(types).to_numpy()
+            per_day = numpy.zeros((n_days, len(METRICS)))
+            numpy.add.at(per_day, days[rows] - self._first_day, daily_totals.loc[rows, list(METRICS)].to_numpy(float))
+            # prefix[i] holds the totals of the days before first_day + i
+            self._prefix[group] = numpy.vstack([numpy.zeros(len(METRICS)), per_day.cumsum(axis=0)])
+
+    def _index(self, day: date) -> int:
+        return min(max((day - EPOCH).days - self._first_day, 0), self._n_days)
+
+    def totals(self, group: str, start: date, end: date) -> dict[str, float]:
+        """
+        Totals of the group's activities from start up to and including end, by their local start date
+        """
+        prefix = self._prefix[group]
+        window = prefix[self._index(end + timedelta(days=1))] - prefix[self._index(start)]
+        return dict(zip(METRICS, window.tolist()))
+
+    def stats(self, today: date) -> dict[str, float]:
+        """
+        Recent (last 4 weeks), year to date and all time totals, keyed like the flattened athlete stats
+        endpoint, e.g. "ytd_run_totals.distance"
+        """
+        windows = {
+            "recent": today - timedelta(days=27),
+            "ytd": today.replace(month=1, day=1),
+            "all": EPOCH,
+        }
+        return {
+            f"{window}_{group}_totals.{metric}": value
+            for window, start in windows.items()
+            for group in self._prefix
+            for metric, value in self.totals(group, start, today).items()
+        }
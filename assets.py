@@ -0,0 +1,89 @@
+import glob
+import hashlib
+import os
+import threading
+from functools import lru_cache
+
+from PIL import Image, ImageFont
+
+import fingerprint
+
+# Directory for pre-resized images that survive between runs, None disables the on-disk cache
+disk_cache_dir = None
+_disk_stats = {"hits": 0, "misses": 0}
+# Panels are drawn on render graph threads
+_disk_stats_lock = threading.Lock()
+
+
+@lru_cache(maxsize=64)
+def get_font(path: str, size: int) -> ImageFont.FreeTypeFont:
+    return ImageFont.truetype(path, size)
+
+
+def get_image(path: str, size: tuple[int, int] | None=None, mode: str | None=None) -> Image.Image:
+    """
+    Returns the image at path resized to size and converted to mode. Results are shared between callers, so
+    they must not be drawn on. The file mtime is part of the in-process key, so edited assets are picked up
+    """
+    return _load_image(path, size, mode, os.path.getmtime(path))
+
+
+@lru_cache(maxsize=128)
+def _load_image(path: str, size: tuple[int, int] | None, mode: str | None, mtime: float) -> Image.Image:
+    cached_path = None
+    if disk_cache_dir and size:
+        # Keyed by content rather than mtime, since a fresh checkout resets every mtime
+        name = hashlib.sha1(repr((os.path.abspath(path), size, mode)).encode()).hexdigest()[:20]
+        cached_path = os.path.join(disk_cache_dir, f"{name}-{fingerprint.file_digest(path)[:20]}.png")
+        if os.path.exists(cached_path):
+            try:
+                with Image.open(cached_path) as img:
+                    img = img.copy()
+                _count("hits")
+                return img
+            except OSError:
+                pass  # Partly written, resize again
+        _count("misses")
+
+    with Image.open(path) as img:
+        img = img.resize(size) if size else img.copy()
+    if mode:
+        img = img.convert(mode)
+
+    if cached_path:
+        os.makedirs(disk_cache_dir, exist_ok=True)
+        tmp_path = f"{cached_path}.{threading.get_ident()}.tmp"
+        try:
+            img.save(tmp_path, format="PNG")
+        except OSError:  # Modes PNG can't hold, e.g. CMYK photos, are only cached in memory
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return img
+        os.replace(tmp_path, cached_path)
+        # Resized copies of earlier versions of the file
+        for stale in glob.glob(os.path.join(disk_cache_dir, f"{name}-*.png")):
+            if stale != cached_path:
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:  # Removed by another thread
+                    pass
+    return img
+
+
+def _count(key: str) -> None:
+    with _disk_stats_lock:
+        _disk_stats[key] += 1
+
+
+def cache_report() -> str:
+    """
+    Hit rates of the font, in-process image and on-disk image caches
+    """
+    def rate(hits, misses):
+        total = hits + misses
+        return f"{hits}/{total} ({hits / total:.0%})" if total else "0/0"
+
+    fonts = get_font.cache_info()
+    images = _load_image.cache_info()
+    return (f"Asset cache hits - fonts: {rate(fonts.hits, fonts.misses)}, images: {rate(images.hits, images.misses)}, "
+            f"disk: {rate(_disk_stats['hits'], _disk_stats['misses'])}")
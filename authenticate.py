@@ -2,20 +2,112 @@
 import requests
 import urllib3
 import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from strava_client import client
+import tracing
+try:
+    import fcntl
+except ImportError:  # Windows, only the in-process lock applies
+    fcntl = None
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-def get_strava_access_token()-> str:
+TOKEN_CACHE_PATH = os.getenv("STRAVA_TOKEN_CACHE", "./cache/token.json")
+# Refresh this many seconds before the token actually expires
+EXPIRY_MARGIN = 300
 
+# One lock per token cache, so athletes rendered together in batch mode refresh their tokens side by side
+_token_locks: dict[str, threading.Lock] = {}
+_token_locks_lock = threading.Lock()
+
+
+def _token_lock(path: str) -> threading.Lock:
+    with _token_locks_lock:
+        return _token_locks.setdefault(os.path.abspath(path), threading.Lock())
+
+
+@contextmanager
+def _locked(path: str):
+    """
+    Serialises refreshes of one token cache across threads and, where supported, across processes sharing
+    the cache file
+    """
+    with _token_lock(path):
+        if fcntl is None:
+            yield
+            return
+        with open(f"{path}.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _read_token_cache(path: str) -> dict | None:
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_token_cache(path: str, token: dict) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(token, f)
+    os.chmod(tmp_path, 0o600)
+    os.replace(tmp_path, path)
+
+
+def _refresh_token(refresh_token: str, credentials: dict) -> dict | None:
     auth_url = "https://www.strava.com/oauth/token"
     payload = {
-        'client_id': os.getenv("STRAVA_CLIENT_ID"),
-        'client_secret': os.getenv("STRAVA_CLIENT_SECRET"),
-        'refresh_token': os.getenv("STRAVA_REFRESH_TOKEN"),
+        'client_id': credentials["client_id"],
+        'client_secret': credentials["client_secret"],
+        'refresh_token': refresh_token,
         'grant_type': "refresh_token",
         'f': 'json'
     }
     print("Requesting Token...\n")
-    res = requests.post(auth_url, data=payload, verify=False)
-    access_token = res.json()['access_token']
-    return  access_token
+    try:
+        with tracing.span("token refresh"):
+            res = client.post(auth_url, data=payload, verify=False)
+    except (requests.ConnectionError, requests.Timeout, requests.exceptions.RetryError) as e:
+        raise RuntimeError(f"Unable to reach Strava to refresh the access token: {e}") from e
+    if not res.ok:
+        return None
+    token = res.json()
+    return {key: token[key] for key in ("access_token", "refresh_token", "expires_at")}
+
+
+def get_strava_access_token(cache_path: str=TOKEN_CACHE_PATH, credentials: dict | None=None) -> str:
+    """
+    Returns the cached access token while it is still valid, otherwise refreshes it and caches the new
+    access token, its expiry and the (possibly rotated) refresh token.
+    credentials holds client_id, client_secret and refresh_token, by default read from the STRAVA_* env vars
+    """
+    credentials = credentials or {
+        'client_id': os.getenv("STRAVA_CLIENT_ID"),
+        'client_secret': os.getenv("STRAVA_CLIENT_SECRET"),
+        'refresh_token': os.getenv("STRAVA_REFRESH_TOKEN"),
+    }
+    os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+    with _locked(cache_path):
+        cached = _read_token_cache(cache_path)
+        if cached and cached["expires_at"] - EXPIRY_MARGIN > time.time():
+            return cached["access_token"]
+
+        token = None
+        if cached:
+            token = _refresh_token(cached["refresh_token"], credentials)
+        if token is None:
+            # No cache yet, or the cached refresh token was revoked, fall back to the configured one
+            token = _refresh_token(credentials["refresh_token"], credentials)
+        if token is None:
+            raise RuntimeError("Unable to refresh the Strava access token")
 
+        _write_token_cache(cache_path, token)
+        return token["access_token"]
@@ -0,0 +1,224 @@
+"""
+Times each stage of the render pipeline against recorded or synthetic Strava data, without network access.
+
+    python benchmark.py --sizes 200,5000,50000 --output bench_output.txt
+    python benchmark.py --fixtures recorded/   # activities.json and stats.json saved from the Strava API
+
+Results are JSON: per activity count, the median and min seconds of every stage and its peak traced memory.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from bisect import bisect_right
+from contextlib import redirect_stdout
+from datetime import date, datetime, timedelta, timezone
+from urllib.parse import urlparse
+
+import requests
+from PIL import Image, ImageDraw
+
+import assets
+import fingerprint
+import strava_client
+from activity_store import to_epoch
+from aggregates import AggregateIndex
+from input_store import InputStore
+from tiles import TileCache
+from summary_screen import Strava
+
+
+def synthetic_activities(n: int, seed: int=0) -> list[dict]:
+    """
+    n activities in the shape of the athlete/activities endpoint, about one a day ending today
+    """
+    rng = random.Random(seed)
+    now = datetime.now(tz=timezone.utc)
+    span = timedelta(days=max(min(n, 3650), 90))
+    activities = []
+    for i in range(n):
+        start = now - span + span * i / n
+        sport = rng.choice(["Run", "Run", "Ride", "VirtualRide", "Walk"])
+        activities.append({
+            "id": 10_000_000 + i,
+            "name": f"Activity {i}",
+            "type": sport,
+            "sport_type": sport,
+            "start_date": start.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "start_date_local": (start - timedelta(hours=5)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "distance": rng.uniform(3_000, 60_000),
+            "moving_time": rng.randint(900, 14_400),
+            "elapsed_time": rng.randint(900, 16_000),
+            "total_elevation_gain": rng.uniform(0, 1_500),
+            "athlete": {"id": 1, "resource_state": 1},
+            "map": {"id": f"a{i}", "summary_polyline": "_p~iF~ps|U_ulLnnqC_mqNvxq`@", "resource_state": 2},
+        })
+    return activities
+
+
+def synthetic_stats() -> dict:
+    totals = {"count": 12, "distance": 120_000.0, "moving_time": 40_000, "elapsed_time": 42_000,
+              "elevation_gain": 900.0}
+    return {f"{window}_{sport}_totals": totals for window in ("recent", "ytd", "all") for sport in ("run", "ride", "swim")}
+
+
+class ReplaySession:
+    """
+    Stand-in for the Strava client's requests.Session that answers from in-memory fixtures
+    """
+    def __init__(self, activities: list[dict], stats: dict):
+        self._activities = sorted(activities, key=lambda activity: activity["start_date"])
+        self._starts = [to_epoch(activity["start_date"]) for activity in self._activities]
+        self._stats = stats
+
+    def request(self, method: str, url: str, params: dict | None=None, **kwargs) -> requests.Response:
+        path = urlparse(url).path
+        params = params or {}
+        status = 200
+        if path.endswith("/oauth/token"):
+            body = {"access_token": "benchmark", "refresh_token": "benchmark", "expires_at": time.time() + 21_600}
+        elif path.endswith("/athlete/activities"):
+            first = bisect_right(self._starts, int(params.get("after", 0)))
+            per_page = int(params.get("per_page", 30))
+            offset = first + (int(params.get("page", 1)) - 1) * per_page
+            body = self._activities[offset:offset + per_page]
+        elif path.endswith("/stats"):
+            body = self._stats
+        else:
+            status, body = 404, {"message": "Record Not Found"}
+
+        res = requests.Response()
+        res.status_code = status
+        res.url = url
+        res.encoding = "utf-8"
+        res.raw = io.BytesIO(json.dumps(body).encode())
+        res.headers["Content-Type"] = "application/json"
+        return res
+
+
+def measure(fn, repeat: int) -> dict:
+    """
+    Runs fn repeat times for timing, then once more under tracemalloc for its peak memory
+    """
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        seconds.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"median_s": statistics.median(seconds), "min_s": min(seconds), "peak_kib": round(peak / 1024, 1)}
+
+
+def new_strava(work_dir: str) -> Strava:
+    """
+    Strava object whose store, token cache, parsed workbook, render history and output all live in work_dir
+    """
+    obj = Strava(output_prefix=os.path.join(work_dir, ""))
+    obj._activity_store_path = os.path.join(work_dir, f"activities-{time.perf_counter_ns()}.db")
+    obj._token_cache_path = os.path.join(work_dir, "token.json")
+    obj._fingerprints = fingerprint.FingerprintStore(os.path.join(work_dir, "render_fingerprints.json"))
+    obj._inputs = InputStore(obj._input_data, work_dir)
+    obj._tiles = TileCache(None)  # Time the drawing, not tile reads
+    return obj
+
+
+def run_benchmark(activities: list[dict], stats: dict, repeat: int) -> dict:
+    strava_client.client.session = ReplaySession(activities, stats)
+    assets.disk_cache_dir = None
+    with tempfile.TemporaryDirectory() as work_dir:
+        stages = {"init": measure(lambda: new_strava(work_dir), repeat)}
+
+        def sync():
+            new_strava(work_dir).sync_activities()
+        stages["sync"] = measure(sync, repeat)
+
+        obj = new_strava(work_dir)
+        obj.sync_activities()
+        stages["load"] = measure(obj.get_activities, repeat)
+        obj.activities = obj.get_activities()
+        stages["aggregate_stats"] = measure(lambda: AggregateIndex(obj._store.daily_totals()).stats(date.today()), repeat)
+        obj.recent_stats = obj.aggregate_index.stats(date.today())
+
+        runs = obj.activities.loc[obj.activities["type"].isin(["Run"]), ["start_date_local", "distance"]]
+        stages["generate_weekly_data"] = measure(lambda: obj.generate_weekly_data(runs, n=12, metric="distance"), repeat)
+
+        weekly_data = obj.generate_weekly_data(runs, n=12, metric="distance")
+        stages["create_line_chart"] = measure(
+            lambda: obj.create_line_chart(Image.new("RGB", (400, 480), "white"), weekly_data, (20, 185), (370, 120),
+                                          metric="distance", is_time=False),
+            repeat,
+        )
+
+        def draw_text():
+            image = Image.new("RGB", (800, 480), "white")
+            draw = ImageDraw.Draw(image)
+            for i in range(50):
+                obj.create_text(draw=draw, text=f"{i:,.1f}km to go", position=(10, i * 9), font_size=16)
+        stages["create_text_x50"] = measure(draw_text, repeat)
+        stages["add_combined_table"] = measure(
+            lambda: obj.add_combined_table(image=Image.new("RGB", (800, 480), "white"), position=(15, 350)), repeat
+        )
+        stages["race_calendar_screen"] = measure(obj.race_calendar_screen, repeat)
+        stages["summary_screen"] = measure(obj.summary_screen, repeat)
+        stages["routes_screen"] = measure(obj.routes_screen, repeat)
+    return stages
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the render pipeline against replayed Strava data")
+    parser.add_argument("--sizes", default="200,1000,10000", help="Comma separated synthetic activity counts")
+    parser.add_argument("--fixtures", help="Directory with recorded activities.json and stats.json to replay instead")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="Write the JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    if args.fixtures:
+        with open(os.path.join(args.fixtures, "activities.json")) as f:
+            datasets = {"recorded": json.load(f)}
+        with open(os.path.join(args.fixtures, "stats.json")) as f:
+            stats = json.load(f)
+    else:
+        datasets = {size: synthetic_activities(int(size)) for size in args.sizes.split(",")}
+        stats = synthetic_stats()
+
+    # Keep the pipeline's progress prints out of the JSON on stdout
+    with redirect_stdout(sys.stderr):
+        runs = [
+            {"dataset": str(name), "activities": len(activities), "stages": run_benchmark(activities, stats, args.repeat)}
+            for name, activities in datasets.items()
+        ]
+    results = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "timestamp": datetime.now(tz=timezone.utc).isoformat(),
+        "runs": runs,
+    }
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
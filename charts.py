@@ -0,0 +1,107 @@
+from datetime import datetime
+
+from PIL import Image, ImageDraw
+
+import assets
+
+LINE_COLOR = "#ff6600"
+# LINE_COLOR at 30% opacity over a white background
+FILL_COLOR = (255, 209, 178)
+AXIS_COLOR = "black"
+# Heart rate zones shade from lightcoral to darkred
+ZONE_COLORS = ((240, 128, 128), (139, 0, 0))
+
+
+def month_starts(start: datetime, end: datetime) -> list[datetime]:
+    """
+    Returns the first day of every month between start and end, inclusive
+    """
+    year, month = start.year, start.month
+    if datetime(year, month, 1) < start:
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+    result = []
+    while datetime(year, month, 1) <= end:
+        result.append(datetime(year, month, 1))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return result
+
+
+def line_chart(dates: list[datetime], values: list[float], size: tuple[int, int], y_labels: tuple[str, str],
+               font_path: str) -> Image:
+    """
+    Draws an area chart of values over dates, with month ticks on the x-axis and ticks at half and max value
+    on the y-axis labelled with y_labels
+    """
+    width, height = size
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+    x_font = assets.get_font(font_path, 11)
+    y_font = assets.get_font(font_path, 8)
+
+    # Plot area, leaving room for the y labels on the left and month labels below
+    left = max(draw.textlength(label, font=y_font) for label in y_labels) + 10
+    right = width - 10
+    top = 5
+    bottom = height - 20
+
+    max_value = max(values)
+    y_max = max_value * 1.03 if max_value > 0 else 1  # Add 3% buffer
+    first, last = min(dates), max(dates)
+    x_range = (last - first).total_seconds() or 1
+
+    def x_of(date):
+        return left + (date - first).total_seconds() / x_range * (right - left)
+
+    def y_of(value):
+        return bottom - value / y_max * (bottom - top)
+
+    points = [(x_of(date), y_of(value)) for date, value in zip(dates, values)]
+    draw.polygon(points + [(points[-1][0], bottom), (points[0][0], bottom)], fill=FILL_COLOR)
+    draw.line(points, fill=LINE_COLOR, width=2, joint="curve")
+    for x, y in points:
+        draw.ellipse([x - 2, y - 2, x + 2, y + 2], fill=LINE_COLOR)
+
+    # y-axis ticks at half and max
+    for value, label in zip([max_value / 2, max_value], y_labels):
+        y = y_of(value)
+        draw.line([(left - 4, y), (left - 1, y)], fill=AXIS_COLOR)
+        draw.text((left - 6, y), label, font=y_font, fill=AXIS_COLOR, anchor="rm")
+
+    # x-axis ticks at the start of each month
+    for month in month_starts(first, last):
+        x = x_of(month)
+        draw.line([(x, bottom + 1), (x, bottom + 4)], fill=AXIS_COLOR)
+        draw.text((x, bottom + 6), month.strftime("%b"), font=x_font, fill=AXIS_COLOR, anchor="mt")
+
+    return image
+
+
+def zone_colors(n: int) -> list[tuple[int, int, int]]:
+    """
+    n colours evenly spaced from the first to the last of ZONE_COLORS
+    """
+    (r1, g1, b1), (r2, g2, b2) = ZONE_COLORS
+    steps = [i / (n - 1) if n > 1 else 0 for i in range(n)]
+    return [(round(r1 + (r2 - r1) * t), round(g1 + (g2 - g1) * t), round(b1 + (b2 - b1) * t)) for t in steps]
+
+
+def pie_chart(values: list[float], diameter: int) -> Image:
+    """
+    Draws a pie of values clockwise from 12 o'clock, shaded with zone_colors. An all-zero pie is a grey ring
+    """
+    image = Image.new("RGB", (diameter, diameter), "white")
+    draw = ImageDraw.Draw(image)
+    box = [0, 0, diameter - 1, diameter - 1]
+    total = sum(values)
+    if total <= 0:
+        draw.ellipse(box, outline="grey", width=2)
+        return image
+
+    start = -90.0
+    for value, color in zip(values, zone_colors(len(values))):
+        end = start + value / total * 360
+        if value > 0:
+            draw.pieslice(box, start=start, end=end, fill=color)
+        start = end
+    return image
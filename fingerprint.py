@@ -0,0 +1,72 @@
+import hashlib
+import json
+import os
+
+import pandas
+
+
+def file_digest(path: str) -> str:
+    """
+    Content hash of a file. Content rather than mtime, since a fresh checkout resets every mtime
+    """
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except OSError:
+        return "missing"
+
+
+def directory_digest(path: str) -> dict[str, str]:
+    try:
+        names = sorted(os.listdir(path))
+    except OSError:
+        return {}
+    return {name: file_digest(os.path.join(path, name)) for name in names}
+
+
+def fingerprint(*parts) -> str:
+    """
+    Stable hash of the given render inputs. DataFrames are hashed by content, everything else as JSON
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, pandas.DataFrame):
+            digest.update(pandas.util.hash_pandas_object(part, index=False).values.tobytes())
+        else:
+            digest.update(json.dumps(part, sort_keys=True, default=str).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class FingerprintStore:
+    """
+    Remembers the input fingerprint each screen was last rendered from, and the content hash of the image it
+    produced, so screens that are skipped can still be listed with their current image
+    """
+    def __init__(self, path: str):
+        self._path = path
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        if "fingerprints" not in data:
+            data = {"fingerprints": data}  # Written before output hashes were kept
+        self._fingerprints = data["fingerprints"]
+        self._outputs = data.get("outputs", {})
+
+    def unchanged(self, screen: str, value: str) -> bool:
+        return self._fingerprints.get(screen) == value
+
+    def output(self, screen: str) -> str | None:
+        return self._outputs.get(screen)
+
+    def record(self, screen: str, value: str, output: str | None=None) -> None:
+        self._fingerprints[screen] = value
+        if output:
+            self._outputs[screen] = output
+        os.makedirs(os.path.dirname(self._path) or ".", exist_ok=True)
+        tmp_path = f"{self._path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"fingerprints": self._fingerprints, "outputs": self._outputs}, f, indent=2)
+        os.replace(tmp_path, self._path)
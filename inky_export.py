@@ -0,0 +1,57 @@
+import struct
+import zlib
+
+import numpy
+from PIL import Image
+
+# Inky Frame 7.3" colours as PicoGraphics renders them, in pen order (BLACK=0, WHITE=1, ... ORANGE=6)
+PALETTE = [
+    (0, 0, 0),        # Black
+    (255, 255, 255),  # White
+    (0, 255, 0),      # Green
+    (0, 0, 255),      # Blue
+    (255, 0, 0),      # Red
+    (255, 255, 0),    # Yellow
+    (255, 128, 0),    # Orange
+]
+
+# Header of the packed format: magic, width, height (little-endian). The body is a zlib stream of rows with
+# two pixels per byte, high nibble first, each nibble a pen number
+MAGIC = b"IF73"
+
+
+def quantize(image: Image) -> Image:
+    """
+    Dithers the image to the Inky Frame palette. Pixel values of the returned "P" image are pen numbers
+    """
+    palette = Image.new("P", (1, 1))
+    # Pad to 256 entries with black; any padded index is mapped back to pen 0 below
+    palette.putpalette([channel for colour in PALETTE for channel in colour] + [0, 0, 0] * (256 - len(PALETTE)))
+    quantized = image.convert("RGB").quantize(palette=palette, dither=Image.Dither.FLOYDSTEINBERG)
+    pens = numpy.asarray(quantized)
+    if (pens >= len(PALETTE)).any():
+        pens = numpy.where(pens >= len(PALETTE), 0, pens).astype(numpy.uint8)
+        quantized = Image.frombytes("P", quantized.size, pens.tobytes())
+    quantized.putpalette([channel for colour in PALETTE for channel in colour])
+    return quantized
+
+
+def pack(quantized: Image) -> bytes:
+    """
+    Encodes a quantized image in the packed 4 bits per pixel format read by inky_frame_main
+    """
+    pens = numpy.asarray(quantized, dtype=numpy.uint8)
+    if pens.shape[1] % 2:
+        pens = numpy.pad(pens, ((0, 0), (0, 1)), constant_values=1)  # Pad odd widths with white
+    packed = (pens[:, 0::2] << 4) | pens[:, 1::2]
+    return MAGIC + struct.pack("<HH", quantized.width, quantized.height) + zlib.compress(packed.tobytes(), 9)
+
+
+def export(image: Image, path: str) -> None:
+    """
+    Writes path.bin for the frame and path.png, an optimised palette PNG of exactly what the frame will show
+    """
+    quantized = quantize(image)
+    with open(f"{path}.bin", "wb") as f:
+        f.write(pack(quantized))
+    quantized.save(f"{path}.png", format="PNG", optimize=True)
@@ -3,47 +3,58 @@
 ############################################################
 
 import gc
+import io
+import json
+import os
+import micropython
 import ntptime
 import time
 import network
 import inky_frame
-from urllib import urequest
+import urequests
 from picographics import PicoGraphics, DISPLAY_INKY_FRAME_7 as DISPLAY
 from secrets import WIFI_SSID, WIFI_PASSWORD
 
 # ----------------------------
 # Configuration
 # ----------------------------
-# URLs of the two images to toggle
-IMAGE_1_URL = "https://vbharath8.github.io/strava-inky/combined_summary.jpg"
-IMAGE_2_URL = "https://vbharath8.github.io/strava-inky/race_calendar.jpg"
+# Published with the images by the render pipeline (manifest.py): the screens to rotate through with their
+# content hashes, when new data is likely and the quiet hours with their current UTC offset
+MANIFEST_URL = "https://vbharath8.github.io/strava-inky/manifest.json"
 
-# Paths in internal flash to save them
-IMAGE_1_PATH = "/combined_summary.jpg"
-IMAGE_2_PATH = "/race_calendar.jpg"
+# Last manifest that was downloaded, used when the server can't be reached
+MANIFEST_FILE = "/manifest.json"
 
-# Times in 24-hour for skipping
-SLEEP_START_HOUR = 21  # 9 PM
-SLEEP_END_HOUR   = 8   # 8 AM
+# Screens are pre-dithered to the frame's palette and packed by inky_export.py, so no JPEG decoding or dithering
+# happens here
+PACKED_MAGIC = b"IF73"
+WHITE = 1
 
-# For Eastern Time, set offset from UTC
-# If currently EST (UTC-5), use -5*3600
-# If currently EDT (UTC-4), use -4*3600
-ET_OFFSET = -5 * 3600
+# Screens are decoded straight from the HTTP response, read READ_SIZE bytes at a time into one reusable buffer.
+# Larger reads mean fewer trips through the network stack, 4 KB keeps the buffer small next to the framebuffer
+READ_SIZE = 4096
 
-# How often to refresh (minutes)
+# Seconds before a stalled connection or read is given up, so a bad network can't keep the frame awake
+HTTP_TIMEOUT = 15
+
+# How long to sleep (minutes) without any manifest, e.g. when Wi-Fi fails on the first boot
 UPDATE_INTERVAL = 15
 
-# File to remember which image was shown last
-LAST_IMAGE_FILE = "/last_image.txt"
+# File to remember the manifest's ETag/Last-Modified and the hash of the image on screen
+IMAGE_STATE_FILE = "/image_state.json"
+
+# Images and state that older versions of this script kept on flash, removed to free the space
+OLD_FILES = ("/combined_summary.jpg", "/race_calendar.jpg", "/combined_summary.bin", "/race_calendar.bin",
+             "/routes.bin", "/heart_rate_zones.bin", "/last_image.txt")
+
+# Some ports count time from 2000 rather than 1970, the manifest's timestamps are Unix time
+EPOCH_OFFSET = 946684800 if time.gmtime(0)[0] == 2000 else 0
 
 # ----------------------------
 # Set up the display
 # ----------------------------
+# No clear/update here: the script re-runs on every wake, and a refresh would wipe an image we may keep
 graphics = PicoGraphics(display=DISPLAY)
-graphics.set_pen(1)
-graphics.clear()
-graphics.update()
 
 # ----------------------------
 # Connect to Wi-Fi
@@ -69,123 +80,330 @@ def connect_wifi():
         return False
 
 # ----------------------------
-# NTP / get current ET hour
+# NTP / current Unix time
 # ----------------------------
-def get_current_hour_et():
+def sync_time():
     try:
         ntptime.settime()  # This sets device time to UTC
-        # Local system time (UTC) plus ET_OFFSET
-        t = time.localtime(time.time() + ET_OFFSET)
-        current_hour = t[3]
         print("UTC now =", time.localtime())
-        print("ET now  =", t)
-        return current_hour
+        return time.time() + EPOCH_OFFSET
     except Exception as e:
         print("NTP sync failed:", e)
-        # Return -1 to indicate we don't have a valid time
-        return -1
+        # None to indicate we don't have a valid time
+        return None
 
 # ----------------------------
-# Download an image
+# Remember image versions
 # ----------------------------
-def download_image(url, save_path):
+def load_image_state():
+    try:
+        with open(IMAGE_STATE_FILE, "r") as f:
+            state = json.load(f)
+    except:
+        return {}
+    # Older versions kept an ETag per image URL and the image on screen as url@version
+    return {key: value for key, value in state.items()
+            if key in (MANIFEST_URL, "index") or (key == "on_screen" and isinstance(value, dict))}
+
+def on_screen(state, screen):
+    """
+    Whether the display already shows this screen's slot with this content
+    """
+    shown = state.get("on_screen") or {}
+    return shown.get("url") == screen["url"] and shown.get("hash") == screen["hash"]
+
+def save_image_state(state):
+    with open(IMAGE_STATE_FILE, "w") as f:
+        json.dump(state, f)
+
+def file_exists(path):
+    try:
+        with open(path, "rb"):
+            return True
+    except OSError:
+        return False
+
+def get_header(response, name):
+    # Header name case differs between servers
+    for key, value in response.headers.items():
+        if key.lower() == name.lower():
+            return value
+    return None
+
+def remove_old_files():
+    for path in OLD_FILES:
+        try:
+            os.remove(path)
+            print(f"Removed {path}")
+        except OSError:
+            pass
+
+# ----------------------------
+# Download a file
+# ----------------------------
+def download_file(url, save_path, state):
+    """
+    Downloads url to save_path, unless the server says the copy already on flash is current.
+    Returns the file version (ETag or Last-Modified), or None on failure
+    """
+    cached = state.get(url, {})
+    headers = {}
+    if file_exists(save_path):
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
     try:
         print(f"Downloading from: {url}")
-        socket = urequest.urlopen(url)
+        response = urequests.get(url, headers=headers, timeout=HTTP_TIMEOUT)
+        if response.status_code == 304:
+            response.close()
+            print("Not modified, using the copy on flash")
+            return cached.get("etag") or cached.get("last_modified")
+        if response.status_code != 200:
+            response.close()
+            print("Error downloading: HTTP", response.status_code)
+            return None
+
         with open(save_path, "wb") as f:
             while True:
-                chunk = socket.read(1024)
+                chunk = response.raw.read(READ_SIZE)
                 if not chunk:
                     break
                 f.write(chunk)
-        socket.close()
-        print(f"Saved image to {save_path}")
-        return True
+        cached = {"etag": get_header(response, "ETag"), "last_modified": get_header(response, "Last-Modified")}
+        response.close()
+        state[url] = cached
+        print(f"Saved to {save_path}")
+        # Without validators, fall back to a version that never matches so the file is always downloaded
+        return cached["etag"] or cached["last_modified"] or str(time.time())
     except Exception as e:
-        print("Error downloading image:", e)
-        return False
+        print("Error downloading:", e)
+        return None
 
 # ----------------------------
 # Display an image
 # ----------------------------
-def draw_image(path):
+class BufferedStream(io.IOBase):
+    """
+    Reads the HTTP response in READ_SIZE blocks through one buffer and hands them out in the small pieces
+    the header and the decompressor ask for
+    """
+    def __init__(self, raw, buffer):
+        self.raw = raw
+        self.buffer = buffer
+        self.view = memoryview(buffer)
+        self.start = 0
+        self.end = 0
+
+    def readinto(self, out):
+        if self.start == self.end:
+            self.start = 0
+            self.end = self.raw.readinto(self.buffer) or 0
+            if not self.end:
+                return 0
+        n = min(len(out), self.end - self.start)
+        out[:n] = self.view[self.start:self.start + n]
+        self.start += n
+        return n
+
+    def read(self, size):
+        data = bytearray(size)
+        view = memoryview(data)
+        received = 0
+        while received < size:
+            n = self.readinto(view[received:])
+            if not n:
+                break
+            received += n
+        return data[:received]
+
+def open_decompressor(stream):
+    try:
+        import deflate
+        return deflate.DeflateIO(stream, deflate.ZLIB)
+    except ImportError:  # Firmware older than MicroPython 1.21
+        import zlib
+        return zlib.DecompIO(stream, 15)
+
+def read_exact(stream, buffer):
+    view = memoryview(buffer)
+    received = 0
+    while received < len(buffer):
+        n = stream.readinto(view[received:])
+        if not n:
+            raise EOFError("Image ended early")
+        received += n
+
+@micropython.native
+def draw_row(row, y, width):
+    # Each byte holds two pens, high nibble first. Draw runs of the same pen, white is already the background
+    x = 0
+    while x < width:
+        byte = row[x >> 1]
+        pen = byte & 0x0F if x & 1 else byte >> 4
+        start = x
+        x += 1
+        while x < width:
+            byte = row[x >> 1]
+            if (byte & 0x0F if x & 1 else byte >> 4) != pen:
+                break
+            x += 1
+        if pen != WHITE:
+            graphics.set_pen(pen)
+            graphics.pixel_span(start, y, x - start)
+
+def draw_packed(stream):
+    header = stream.read(8)
+    if header[:4] != PACKED_MAGIC:
+        raise ValueError("Not a packed Inky Frame image")
+    width = header[4] | header[5] << 8
+    height = header[6] | header[7] << 8
+
+    pixels = open_decompressor(stream)
+    row = bytearray((width + 1) // 2)
+    graphics.set_pen(WHITE)
+    graphics.clear()
+    for y in range(height):
+        read_exact(pixels, row)
+        draw_row(row, y, width)
+    graphics.update()
+
+def show_image(url):
+    """
+    Downloads url and draws it as it arrives, nothing is written to flash. The display is only updated once the
+    whole image was drawn, so a failed download leaves the current image on screen
+    """
+    response = None
     try:
         gc.collect()
-        import jpegdec
-        jpeg = jpegdec.JPEG(graphics)
-        graphics.set_pen(1)
-        graphics.clear()
-        jpeg.open_file(path)
-        jpeg.decode()
-        graphics.update()
-        print(f"Displayed image: {path}")
+        print(f"Downloading from: {url}")
+        response = urequests.get(url, timeout=HTTP_TIMEOUT)
+        if response.status_code != 200:
+            print("Error downloading image: HTTP", response.status_code)
+            return False
+        draw_packed(BufferedStream(response.raw, bytearray(READ_SIZE)))
+        print(f"Displayed image: {url}")
+        return True
     except Exception as e:
         print("Error displaying image:", e)
+        return False
+    finally:
+        if response:
+            response.close()
+
+# ----------------------------
+# Refresh manifest
+# ----------------------------
+def load_manifest(state):
+    """
+    Downloads the manifest unless the copy on flash is current, falling back to that copy when offline
+    """
+    if download_file(MANIFEST_URL, MANIFEST_FILE, state) is None:
+        print("Using the last downloaded manifest")
+    try:
+        with open(MANIFEST_FILE, "r") as f:
+            return json.load(f)
+    except Exception as e:
+        print("No manifest available:", e)
+        return None
+
+def minutes_until_quiet_end(manifest, now):
+    """
+    Minutes to sleep when now falls in the quiet hours, else 0
+    """
+    quiet = manifest["quiet_hours"]
+    if quiet["start"] <= now < quiet["end"]:
+        return (quiet["end"] - now + 59) // 60
+    if now < quiet["end"]:
+        return 0
+    # The manifest is older than its quiet window, work it out from the hours and the last known UTC offset
+    hour, minute = local_time(manifest, now)
+    start_hour, end_hour = quiet["start_hour"], quiet["end_hour"]
+    if start_hour <= hour or hour < end_hour:
+        return ((end_hour - hour) % 24) * 60 - minute
+    return 0
+
+def local_time(manifest, now):
+    """
+    Hour and minute of the day in the frame's timezone, at the UTC offset the manifest was generated with
+    """
+    t = time.gmtime(now + manifest["quiet_hours"]["utc_offset"] - EPOCH_OFFSET)
+    return t[3], t[4]
+
+def minutes_until_next_wake(manifest, now):
+    """
+    Until the next screen rotation, half an hour after the next likely upload hour or local midnight,
+    whichever comes first, moved out of the quiet hours. Worked out here from the manifest's update hours
+    rather than its next_wake, which is stale when no newer manifest has been published since
+    """
+    if now is None:
+        return manifest.get("fallback_wake_minutes", UPDATE_INTERVAL)
+    hour, minute = local_time(manifest, now)
+    day_minute = hour * 60 + minute
+    candidates = [24 * 60 - day_minute]
+    for update_hour in manifest.get("update_hours", []):
+        # The next update_hour:30 strictly after now
+        candidates.append((update_hour * 60 + 30 - day_minute - 1) % (24 * 60) + 1)
+    minutes = min(max(min(candidates), manifest.get("min_wake_minutes", UPDATE_INTERVAL)),
+                  manifest.get("max_wake_minutes", 240))
+    rotate_seconds = manifest["rotate_minutes"] * 60
+    if len(manifest["screens"]) > 1:
+        minutes = min(minutes, (rotate_seconds - now % rotate_seconds + 59) // 60)
+    minutes += minutes_until_quiet_end(manifest, now + minutes * 60)
+    return max(minutes, 1)
 
 # ----------------------------
 # Main logic
 # ----------------------------
 def main():
-    # Attempt Wi-Fi so we can NTP sync
+    state = load_image_state()
+
+    # Attempt Wi-Fi so we can NTP sync and fetch the manifest
     if not connect_wifi():
         # If Wi-Fi fails entirely, just sleep and try again
-        print("Sleeping 15 min, then retry Wi-Fi...")
+        print(f"Sleeping {UPDATE_INTERVAL} min, then retry Wi-Fi...")
+        inky_frame.sleep_for(UPDATE_INTERVAL)
+        return
+
+    remove_old_files()
+    now = sync_time()
+    manifest = load_manifest(state)
+    save_image_state(state)
+    if manifest is None or not manifest["screens"]:
+        print(f"Nothing to show, sleeping {UPDATE_INTERVAL} minutes...")
         inky_frame.sleep_for(UPDATE_INTERVAL)
         return
 
-    # Now get current ET hour from NTP
-    current_hour_et = get_current_hour_et()
-    if current_hour_et == -1:
-        # If we failed to get valid time, we can't do time-based skipping
-        print("Skipping NTP-based sleep. Will just toggle image.")
+    if now is None:
+        # Without a valid time we can't do time-based skipping or rotation, so just show the next screen
+        print("Skipping NTP-based sleep. Will just rotate the screen.")
+        index = state.get("index", -1) + 1
     else:
-        # If we have a valid time, check if it's within the skip window
-        # 9 PM <= hour < 24, or 0 <= hour < 8 AM
-        if current_hour_et >= SLEEP_START_HOUR or current_hour_et < SLEEP_END_HOUR:
-            # It's within the 9 PM–8 AM window
-            print("Within the 9 PM–8 AM window, sleeping until 8 AM...")
-            # Calculate how many hours until 8 AM
-            # If it's 21 (9 PM), we want to sleep 11 hours until 8 AM.
-            # If it's 23 (11 PM), we want to sleep 9 hours, etc.
-            # If it's 0, we sleep 8 hours, and so forth.
-            hours_until_8 = 0
-            if current_hour_et >= SLEEP_START_HOUR:
-                # e.g. 21 (9 PM) => 21->24 is 3 hours, plus 8 more => 11 hours total
-                hours_until_8 = (24 - current_hour_et) + SLEEP_END_HOUR
-            else:
-                # e.g. if hour is 2, then we just need 6 hours until 8
-                hours_until_8 = SLEEP_END_HOUR - current_hour_et
-
-            minutes_until_8 = hours_until_8 * 60
-            print(f"Sleeping {minutes_until_8} minutes (until ~8 AM ET).")
-            inky_frame.sleep_for(minutes_until_8)
+        quiet_minutes = minutes_until_quiet_end(manifest, now)
+        if quiet_minutes > 0:
+            print(f"Within the quiet hours, sleeping {quiet_minutes} minutes...")
+            inky_frame.sleep_for(quiet_minutes)
             return
+        # Every frame shows the same screen in the same rotate_minutes slot
+        index = now // (manifest["rotate_minutes"] * 60)
+    screens = manifest["screens"]
+    screen = screens[index % len(screens)]
+    state["index"] = index % len(screens)
 
-    # Now we toggle the image
-    try:
-        with open(LAST_IMAGE_FILE, "r") as f:
-            last_image = int(f.read().strip())
-    except:
-        last_image = 1  # Default if file doesn't exist
-
-    if last_image == 1:
-        print("Displaying Image 1...")
-        if download_image(IMAGE_1_URL, IMAGE_1_PATH):
-            draw_image(IMAGE_1_PATH)
-            last_image = 2
+    if on_screen(state, screen):
+        # Same image is already on the display, skip the download and the e-ink refresh
+        print(f"{screen['name']} screen already on display, skipping refresh")
     else:
-        print("Displaying Image 2...")
-        if download_image(IMAGE_2_URL, IMAGE_2_PATH):
-            draw_image(IMAGE_2_PATH)
-            last_image = 1
-
-    # Save which image we displayed
-    with open(LAST_IMAGE_FILE, "w") as f:
-        f.write(str(last_image))
-
-    # Finally, sleep for 15 minutes
-    print(f"Now sleeping for {UPDATE_INTERVAL} minutes...\n")
-    inky_frame.sleep_for(UPDATE_INTERVAL)
+        print(f"Displaying the {screen['name']} screen...")
+        if show_image(screen["url"]):
+            state["on_screen"] = {"url": screen["url"], "hash": screen["hash"]}
+    save_image_state(state)
+
+    minutes = minutes_until_next_wake(manifest, now)
+    print(f"Now sleeping for {minutes} minutes...\n")
+    inky_frame.sleep_for(minutes)
 
 # ----------------------------
 # Run
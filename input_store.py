@@ -0,0 +1,88 @@
+import glob
+import os
+import threading
+from datetime import datetime
+from functools import cached_property
+
+import pandas
+
+import fingerprint
+import tracing
+
+
+class InputStore:
+    """
+    Race calendar and quotes from the input_data workbook. openpyxl is slow, so the workbook is parsed once and
+    its sheets are pickled under cache_dir, keyed by the workbook's content hash. Later runs, and every later
+    access within a run, read the parsed sheets instead
+    """
+    def __init__(self, workbook_path: str, cache_dir: str | None):
+        self._workbook_path = workbook_path
+        self._cache_dir = cache_dir
+        self._lock = threading.Lock()
+
+    @cached_property
+    def digest(self) -> str:
+        return fingerprint.file_digest(self._workbook_path)
+
+    @cached_property
+    def _sheets(self) -> dict[str, pandas.DataFrame]:
+        with self._lock:
+            if "_sheets" in self.__dict__:
+                # Another thread loaded it while this one waited for the lock
+                return self.__dict__["_sheets"]
+            if not self._cache_dir:
+                return self._read_workbook()
+
+            name = os.path.splitext(os.path.basename(self._workbook_path))[0]
+            cache_path = os.path.join(self._cache_dir, f"{name}-{self.digest}.pkl")
+            if os.path.exists(cache_path):
+                try:
+                    with tracing.span("input cache load"):
+                        return pandas.read_pickle(cache_path)
+                except (OSError, ValueError, EOFError):
+                    pass  # Partly written or from an incompatible pandas, parse the workbook again
+
+            sheets = self._read_workbook()
+            os.makedirs(self._cache_dir, exist_ok=True)
+            tmp_path = f"{cache_path}.tmp"
+            pandas.to_pickle(sheets, tmp_path)
+            os.replace(tmp_path, cache_path)
+            # Older versions of the workbook won't be read again
+            for stale in glob.glob(os.path.join(self._cache_dir, f"{name}-*.pkl")):
+                if stale != cache_path:
+                    os.remove(stale)
+            return sheets
+
+    def _read_workbook(self) -> dict[str, pandas.DataFrame]:
+        with tracing.span("excel load"):
+            return pandas.read_excel(self._workbook_path, sheet_name=["race_calendar", "quotes"])
+
+    @cached_property
+    def races(self) -> pandas.DataFrame:
+        """
+        Race calendar sorted by date, so date lookups are a binary search
+        """
+        races = self._sheets["race_calendar"].copy()
+        races["date"] = pandas.to_datetime(races["date"])
+        return races.sort_values("date", kind="stable").reset_index(drop=True)
+
+    @cached_property
+    def quotes(self) -> list[str]:
+        return self._sheets["quotes"]["quote"].dropna().astype(str).tolist()
+
+    def upcoming_races(self, today: datetime, n: int) -> pandas.DataFrame:
+        """
+        The next n races on or after today, soonest first
+        """
+        first = self.races["date"].searchsorted(pandas.Timestamp(today), side="left")
+        return self.races.iloc[first:first + n]
+
+    def latest_posted_race(self, today: datetime) -> pandas.Series | None:
+        """
+        The most recent race before today that has a Strava post
+        """
+        end = self.races["date"].searchsorted(pandas.Timestamp(today), side="left")
+        past = self.races.iloc[:end]
+        past = past[past["strava_event"] != "No"]
+        return past.iloc[-1] if not past.empty else None
@@ -0,0 +1,65 @@
+import codecs
+import json
+import re
+from itertools import islice
+from typing import Any, Iterable, Iterator
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+def iter_array(chunks: Iterable[bytes]) -> Iterator[Any]:
+    """
+    Yields the elements of a UTF-8 JSON array as its bytes arrive, e.g. from Response.iter_content, so only the
+    element being parsed and the unparsed tail of the current chunk are held in memory
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    pos = 0
+    started = False
+    for chunk in _with_end(chunks):
+        final = chunk is None
+        buffer = buffer[pos:] + (text.decode(b"", final=True) if final else text.decode(chunk))
+        pos = 0
+        while True:
+            pos = _WHITESPACE.match(buffer, pos).end()
+            if pos == len(buffer):
+                break
+            if not started:
+                if buffer[pos] != "[":
+                    raise ValueError(f"Expected a JSON array, got {buffer[pos:pos + 20]!r}")
+                started = True
+                pos += 1
+            elif buffer[pos] == ",":
+                pos += 1
+            elif buffer[pos] == "]":
+                return
+            else:
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if final:
+                        raise
+                    break  # Element continues in the next chunk
+                after = _WHITESPACE.match(buffer, end).end()
+                if after == len(buffer) or buffer[after] not in ",]":
+                    if final:
+                        raise ValueError(f"Expected ',' or ']' after an array element, got {buffer[after:after + 20]!r}")
+                    break  # A number such as 12.5 can be cut anywhere, wait for what follows it
+                yield value
+                pos = end
+    raise ValueError("JSON array ended early")
+
+
+def _with_end(chunks: Iterable[bytes]) -> Iterator[bytes | None]:
+    yield from chunks
+    yield None
+
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    """
+    Splits items into lists of at most size items
+    """
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
@@ -0,0 +1,103 @@
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import pandas
+
+# Image format of the published screens, see inky_export.py
+SCREEN_FORMAT = "IF73"
+
+
+def likely_update_hours(activities: pandas.DataFrame, now: datetime, days: int=90, share: float=0.2) -> list[int]:
+    """
+    Local hours of the day in which the athlete's activities of the last days usually end, i.e. when an upload
+    and with it new data is likely. An hour counts when it has at least share of the busiest hour's activities
+    """
+    recent = activities[activities["start_date_local"] >= pandas.Timestamp(now.replace(tzinfo=None)) - pandas.Timedelta(days=days)]
+    if recent.empty:
+        return []
+    ends = recent["start_date_local"] + pandas.to_timedelta(recent["elapsed_time"], unit="s")
+    counts = ends.dt.hour.value_counts()
+    return sorted(int(hour) for hour in counts[counts >= counts.max() * share].index)
+
+
+def quiet_window(now: datetime, start_hour: int, end_hour: int) -> tuple[datetime, datetime]:
+    """
+    The quiet window now falls in, or else the next one. now is timezone aware, in the frame's timezone, and
+    the window is worked out in wall-clock hours so it follows daylight saving time
+    """
+    for days in (-1, 0, 1):
+        start = (now + timedelta(days=days)).replace(hour=start_hour, minute=0, second=0, microsecond=0)
+        end = (start + timedelta(days=1 if end_hour <= start_hour else 0)).replace(hour=end_hour)
+        if now.timestamp() < end.timestamp():
+            return start, end
+    raise ValueError("No quiet window found")
+
+
+def next_wake(now: datetime, update_hours: list[int], quiet: tuple[datetime, datetime], min_minutes: int,
+              max_minutes: int) -> datetime:
+    """
+    When the frame should next look for new screens: half an hour after the next likely upload hour, or
+    local midnight when the date-dependent parts change, whichever comes first. Kept between min_minutes and
+    max_minutes from now and moved out of the quiet hours
+    """
+    midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    candidates = [midnight]
+    for hour in update_hours:
+        candidate = now.replace(hour=hour, minute=30, second=0, microsecond=0)
+        if candidate.timestamp() <= now.timestamp():
+            candidate = (now + timedelta(days=1)).replace(hour=hour, minute=30, second=0, microsecond=0)
+        candidates.append(candidate)
+
+    wake = min(candidates, key=lambda candidate: candidate.timestamp()).timestamp()
+    wake = min(max(wake, now.timestamp() + min_minutes * 60), now.timestamp() + max_minutes * 60)
+    quiet_start, quiet_end = quiet
+    if quiet_start.timestamp() <= wake < quiet_end.timestamp():
+        wake = quiet_end.timestamp()
+    return datetime.fromtimestamp(wake, tz=now.tzinfo)
+
+
+def build_manifest(screens: list[dict], device: dict, activities: pandas.DataFrame | None=None,
+                   now: datetime | None=None) -> dict:
+    """
+    The refresh manifest the Inky Frame follows: the screens to rotate through with their content hashes,
+    when to wake next and the quiet hours as UTC timestamps, since the frame only knows UTC
+    """
+    quiet_hours = device.get("quiet_hours", {})
+    tz = ZoneInfo(quiet_hours.get("timezone", "America/New_York"))
+    now = (now or datetime.now(tz=timezone.utc)).astimezone(tz)
+    start_hour, end_hour = quiet_hours.get("start", 21), quiet_hours.get("end", 8)
+    quiet_start, quiet_end = quiet_window(now, start_hour, end_hour)
+    update_hours = likely_update_hours(activities, now) if activities is not None else []
+    wake = next_wake(now, update_hours, (quiet_start, quiet_end), device.get("min_wake_minutes", 15),
+                     device.get("max_wake_minutes", 240))
+    return {
+        "generated_at": int(now.timestamp()),
+        "screens": [{**screen, "format": SCREEN_FORMAT} for screen in screens],
+        "rotate_minutes": device.get("rotate_minutes", 60),
+        # The frame works its wake up out from update_hours and the quiet hours itself, so it stays right
+        # however old the manifest is, next_wake is what that gives as of generated_at
+        "next_wake": int(wake.timestamp()),
+        # Used by the frame when it has no valid time
+        "fallback_wake_minutes": device.get("fallback_wake_minutes", 60),
+        "update_hours": update_hours,
+        "min_wake_minutes": device.get("min_wake_minutes", 15),
+        "max_wake_minutes": device.get("max_wake_minutes", 240),
+        "quiet_hours": {
+            "start": int(quiet_start.timestamp()),
+            "end": int(quiet_end.timestamp()),
+            "start_hour": start_hour,
+            "end_hour": end_hour,
+            "timezone": tz.key,
+            "utc_offset": int(now.utcoffset().total_seconds()),
+        },
+    }
+
+
+def write_manifest(path: str, manifest: dict) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
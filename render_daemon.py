@@ -0,0 +1,167 @@
+import json
+import os
+import queue
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import tracing
+
+# Events waiting to be applied. A burst of uploads is a handful, anything beyond this is refused so a flood of
+# requests can't queue unbounded work
+MAX_PENDING_EVENTS = 100
+# Webhook events are a few hundred bytes, larger bodies are refused before they are read
+MAX_EVENT_BYTES = 4096
+
+
+class RenderDaemon:
+    """
+    Keeps one Strava object warm (fonts, icons, tiles, workbook, activity store and HTTP pool) and re-renders
+    its screens whenever webhook events arrive. Events arriving within debounce seconds of each other are applied
+    together and rendered once. Screens are also re-rendered every refresh_interval seconds without events, for
+    the date-dependent parts, after a sync that picks up any activity whose event was missed; unchanged screens
+    are skipped as usual. Only events of the given subscription about the athlete's own activities are accepted
+    """
+    def __init__(self, strava, screens: list[str], subscription_id: int | None, debounce: float=2.0,
+                 refresh_interval: float=3600):
+        self.strava = strava
+        self.screens = screens
+        self.subscription_id = subscription_id
+        self.debounce = debounce
+        self.refresh_interval = refresh_interval
+        self._events = queue.Queue(maxsize=MAX_PENDING_EVENTS)
+        self._worker = threading.Thread(target=self._run, name="render-daemon", daemon=True)
+
+    def start(self) -> None:
+        self._worker.start()
+
+    def accepts(self, event: dict) -> bool:
+        return (self.subscription_id is not None and event.get("subscription_id") == self.subscription_id
+                and self.strava.owns_event(event))
+
+    def submit(self, event: dict) -> bool:
+        """
+        Queues the event, False when too many are already waiting
+        """
+        try:
+            self._events.put_nowait(event)
+        except queue.Full:
+            return False
+        return True
+
+    def _run(self) -> None:
+        while True:
+            try:
+                events = [self._events.get(timeout=self.refresh_interval)]
+            except queue.Empty:
+                events = []
+            else:
+                # Wait for the rest of a burst, e.g. an upload followed by its title and description edits
+                deadline = time.monotonic() + self.debounce
+                while (remaining := deadline - time.monotonic()) > 0:
+                    try:
+                        events.append(self._events.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+            try:
+                self.render(events)
+            except Exception:
+                traceback.print_exc()
+
+    def render(self, events: list[dict], force: bool=False) -> list[str]:
+        start = time.perf_counter()
+        with tracing.span("daemon render", events=len(events)):
+            self.strava.apply_events(coalesce(events), sync=not events)
+            rendered = self.strava.render(self.screens, force=force)
+        print(f"Rendered {', '.join(rendered) or 'nothing'} for {len(events)} event(s) "
+              f"in {time.perf_counter() - start:.2f}s")
+        print("Timings:\n" + tracing.format_summary())
+        tracing.reset()
+        return rendered
+
+
+def coalesce(events: list[dict]) -> list[dict]:
+    """
+    Keeps the last event per object, in the order the objects were last touched
+    """
+    latest = {}
+    for event in events:
+        key = (event.get("object_type"), event.get("object_id"))
+        latest.pop(key, None)
+        latest[key] = event
+    return list(latest.values())
+
+
+def make_handler(daemon: RenderDaemon, verify_token: str | None):
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            """
+            Strava's subscription validation, echoes hub.challenge when the verify token matches
+            """
+            params = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+            if not verify_token or params.get("hub.mode") != "subscribe" or params.get("hub.verify_token") != verify_token:
+                self._reply(403, {"error": "invalid verify token"})
+                return
+            self._reply(200, {"hub.challenge": params.get("hub.challenge")})
+
+        def do_POST(self):
+            """
+            Strava expects a 200 within two seconds, so the event is only checked and queued here
+            """
+            length = self.headers.get("Content-Length", "")
+            if not (length.isascii() and length.isdigit()):
+                # The body can't be skipped without its length
+                self.close_connection = True
+                self._reply(400, {"error": "missing or invalid Content-Length"})
+                return
+            if int(length) > MAX_EVENT_BYTES:
+                self.close_connection = True
+                self._reply(413, {"error": "event too large"})
+                return
+            try:
+                event = json.loads(self.rfile.read(int(length)))
+            except ValueError:
+                self._reply(400, {"error": "invalid JSON"})
+                return
+            if not isinstance(event, dict) or not daemon.accepts(event):
+                self._reply(403, {"error": "unknown subscription or athlete"})
+                return
+            if not daemon.submit(event):
+                self._reply(503, {"error": "too many pending events"})
+                return
+            self._reply(200, {})
+
+        def _reply(self, status: int, body: dict) -> None:
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    return WebhookHandler
+
+
+def serve(strava, screens: list[str], host: str, port: int, debounce: float=2.0, refresh_interval: float=3600) -> None:
+    """
+    Renders every screen on start up, then serves the Strava webhook endpoint until interrupted.
+    The subscription's verify token is read from STRAVA_VERIFY_TOKEN and its id from STRAVA_SUBSCRIPTION_ID,
+    events are refused without it
+    """
+    subscription_id = os.getenv("STRAVA_SUBSCRIPTION_ID")
+    if not subscription_id:
+        print("STRAVA_SUBSCRIPTION_ID is not set, webhook events will be refused")
+    daemon = RenderDaemon(strava, screens, int(subscription_id) if subscription_id else None, debounce=debounce,
+                          refresh_interval=refresh_interval)
+    daemon.render([], force=True)
+    daemon.start()
+    server = ThreadingHTTPServer((host, port), make_handler(daemon, os.getenv("STRAVA_VERIFY_TOKEN")))
+    print(f"Listening for Strava webhook events on {host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,47 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable
+
+import tracing
+
+
+class RenderGraph:
+    """
+    Small dependency graph of render tasks. Each task runs on a thread pool as soon as the tasks it depends on
+    have finished and is called with their results, so independent panels and screens render side by side.
+    Threads rather than processes, since Pillow releases the GIL while resizing, compositing and encoding
+    and the tasks share the loaded Strava data
+    """
+    def __init__(self):
+        self._tasks: dict[str, tuple[Callable, tuple[str, ...]]] = {}
+
+    def add(self, name: str, fn: Callable, deps: tuple[str, ...]=()) -> None:
+        self._tasks[name] = (fn, deps)
+
+    def run(self, max_workers: int=4) -> dict[str, Any]:
+        """
+        Runs every task and returns their results by name. The first failing task's exception is raised
+        """
+        results = {}
+        pending = dict(self._tasks)
+        running = {}
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="render") as executor:
+            while pending or running:
+                for name, (fn, deps) in list(pending.items()):
+                    if all(dep in results for dep in deps):
+                        task = tracing.bind(self._traced(name, fn))
+                        running[executor.submit(task, *[results[dep] for dep in deps])] = name
+                        del pending[name]
+                if not running:
+                    raise ValueError(f"Unresolvable dependencies for {', '.join(pending)}")
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)] = future.result()
+        return results
+
+    @staticmethod
+    def _traced(name: str, fn: Callable) -> Callable:
+        def run(*args):
+            with tracing.span(name):
+                return fn(*args)
+        return run
@@ -0,0 +1,63 @@
+import math
+
+import numpy
+from PIL import Image, ImageDraw
+
+from charts import LINE_COLOR
+
+
+def decode_polyline(encoded: str) -> numpy.ndarray:
+    """
+    Decodes a Google encoded polyline, as in Strava's map.summary_polyline, into an (n, 2) array of latitude and
+    longitude. Every value is a run of 5-bit chunks, the last of which is below 0x20, so the runs are summed with
+    one reduceat instead of a loop per character
+    """
+    chunks = numpy.frombuffer(encoded.encode("ascii"), dtype=numpy.uint8).astype(numpy.int64) - 63
+    if not len(chunks):
+        return numpy.empty((0, 2))
+    ends = chunks < 0x20
+    starts = numpy.flatnonzero(numpy.concatenate([[True], ends[:-1]]))
+    # Position of every chunk within its value, for the 5-bit shift
+    position = numpy.arange(len(chunks)) - numpy.repeat(starts, numpy.diff(numpy.append(starts, len(chunks))))
+    values = numpy.add.reduceat((chunks & 0x1f) << (5 * position), starts)
+    values = numpy.where(values & 1, ~(values >> 1), values >> 1)  # Zigzag encoded sign
+    return numpy.cumsum(values[:len(values) // 2 * 2].reshape(-1, 2), axis=0) / 1e5
+
+
+def project(latlng: numpy.ndarray, size: tuple[int, int], margin: int=4) -> numpy.ndarray:
+    """
+    Equirectangular projection of the route, scaled to fit size with its aspect ratio kept and centred.
+    Fine at the scale of a single activity
+    """
+    x = latlng[:, 1] * math.cos(math.radians(latlng[:, 0].mean()))
+    y = -latlng[:, 0]
+    span = max(x.max() - x.min(), y.max() - y.min()) or 1
+    scale = (min(size) - 2 * margin) / span
+    return numpy.column_stack([
+        (x - x.min()) * scale + (size[0] - (x.max() - x.min()) * scale) / 2,
+        (y - y.min()) * scale + (size[1] - (y.max() - y.min()) * scale) / 2,
+    ])
+
+
+def simplify(points: numpy.ndarray) -> numpy.ndarray:
+    """
+    Snaps the points to whole pixels and drops the ones that land on the same pixel as the previous point,
+    which leaves at most one point per pixel the line passes through
+    """
+    pixels = numpy.rint(points).astype(numpy.int32)
+    keep = numpy.ones(len(pixels), dtype=bool)
+    keep[1:] = numpy.any(pixels[1:] != pixels[:-1], axis=1)
+    return pixels[keep]
+
+
+def route_thumbnail(encoded: str, size: tuple[int, int], width: int=2, color: str=LINE_COLOR) -> Image.Image:
+    """
+    Draws the route on a white image of the given size
+    """
+    image = Image.new("RGB", size, "white")
+    latlng = decode_polyline(encoded)
+    if len(latlng) < 2:
+        return image
+    points = simplify(project(latlng, size, margin=width + 2))
+    ImageDraw.Draw(image).line(points.ravel().tolist(), fill=color, width=width, joint="curve")
+    return image
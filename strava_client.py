@@ -0,0 +1,133 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import tracing
+
+# (connect, read) timeout in seconds for every call
+TIMEOUT = (5, 30)
+MAX_RATE_LIMIT_RETRIES = 3
+
+
+class StravaClient:
+    """
+    Shared keep-alive HTTP session for all Strava calls, with timeouts, retries on server errors
+    and back-off when the X-RateLimit-Usage headers say the 15-minute budget is used up
+    """
+    def __init__(self, pool_size: int=8, timeout: tuple[float, float]=TIMEOUT):
+        self.timeout = timeout
+        self.session = requests.Session()
+        # Only GETs are retried, a repeated token refresh POST could use up a rotated refresh token. The last
+        # server error is returned rather than raised as a RetryError, so callers see the usual HTTP error
+        retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[500, 502, 503, 504],
+                      allowed_methods=frozenset({"GET"}), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="strava")
+        self._lock = threading.Lock()
+        self._blocked_until = 0.0
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            self._wait_for_budget()
+            with tracing.span(f"http {method}", path=urlparse(url).path, attempt=attempt) as span:
+                res = self.session.request(method, url, **kwargs)
+                span.attributes["status"] = res.status_code
+                if kwargs.get("stream"):
+                    self._trace_body(res, span)
+                else:
+                    span.attributes["bytes"] = len(res.content)
+            self._record_usage(res)
+            if res.status_code != 429 or attempt == MAX_RATE_LIMIT_RETRIES:
+                return res
+            print(f"Rate limited by Strava, retrying after {max(self._blocked_until - time.time(), 1):.0f}s")
+        return res
+
+    @staticmethod
+    def _trace_body(res: requests.Response, span: tracing.Span) -> None:
+        """
+        A streamed body is read after request() returns, so its bytes are counted as they are read and the span
+        is extended to when the body has been read. Chunked responses have no Content-Length to go by
+        """
+        iter_content = res.iter_content
+
+        def traced_iter_content(*args, **kwargs):
+            try:
+                for chunk in iter_content(*args, **kwargs):
+                    span.attributes["bytes"] += len(chunk)
+                    yield chunk
+            finally:
+                span.end_ns = time.time_ns()
+
+        # iter_lines, json and content all read through iter_content
+        res.iter_content = traced_iter_content
+        span.attributes["bytes"] = 0
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """
+        Runs fn on the client's thread pool, so independent calls can be in flight together
+        """
+        return self._executor.submit(tracing.bind(fn), *args, **kwargs)
+
+    def _wait_for_budget(self) -> None:
+        with self._lock:
+            wait = self._blocked_until - time.time()
+        if wait > 0:
+            time.sleep(wait)
+
+    def _record_usage(self, res: requests.Response) -> None:
+        """
+        Blocks further calls until the next 15-minute window when the short-term limit is reached
+        """
+        usage = self._parse_header(res.headers.get("X-RateLimit-Usage"))
+        limit = self._parse_header(res.headers.get("X-RateLimit-Limit"))
+        if usage is None or limit is None:
+            if res.status_code == 429:
+                self._block(time.time() + float(res.headers.get("Retry-After", 60)))
+            return
+
+        if res.status_code == 429 and usage[1] >= limit[1]:
+            # Waiting for the daily window would hang the job until midnight UTC
+            raise RuntimeError(f"Strava daily rate limit exhausted ({usage[1]}/{limit[1]})")
+        if usage[0] >= limit[0] or res.status_code == 429:
+            self._block(self.next_window_start())
+
+    def _block(self, until: float) -> None:
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, until)
+
+    @staticmethod
+    def _parse_header(value: str | None) -> tuple[int, int] | None:
+        """
+        Rate limit headers are "<15 minute>,<daily>"
+        """
+        if not value:
+            return None
+        short_term, daily = value.split(",")[:2]
+        return int(short_term), int(daily)
+
+    @staticmethod
+    def next_window_start() -> float:
+        """
+        Strava's 15-minute windows reset at 0, 15, 30 and 45 minutes past the hour
+        """
+        now = datetime.now(tz=timezone.utc)
+        window_start = now.replace(minute=now.minute - now.minute % 15, second=0, microsecond=0)
+        return window_start.timestamp() + 15 * 60
+
+
+client = StravaClient()
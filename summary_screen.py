@@ -1,21 +1,58 @@
+import time
+_import_start = time.time_ns()
+
+import tracing
 import pandas
-import authenticate
-import requests
-import matplotlib.pyplot as plt
-import io
-from PIL import Image, ImageDraw, ImageFont
+import aggregates
+import assets
+import charts
+import fingerprint
+import inky_export
+import json_stream
+import manifest
+import route_map
+from input_store import InputStore
+from render_graph import RenderGraph
+import tiles
+from PIL import Image, ImageDraw
 import textwrap
+import zlib
 import yaml
 from datetime import datetime
-import matplotlib.dates as mdates
+from functools import cached_property
+from concurrent.futures import ThreadPoolExecutor
+import argparse
 import platform
+import os
+import sys
+import json
+import traceback
 from zoneinfo import ZoneInfo
 
+tracing.record("import", _import_start, time.time_ns())
+
+# Output file name of each screen, without the extension
+SCREEN_FILES = {
+    "summary": "combined_summary",
+    "race": "race_calendar",
+    "routes": "routes",
+    "zones": "heart_rate_zones",
+}
+# How long zones Strava refused (no Summit subscription) are taken as missing before they are asked for again
+UNAVAILABLE_ZONES_SECONDS = 7 * 24 * 3600
+
 
 class Strava:
-    def __init__(self):
-        self._access_token = authenticate.get_strava_access_token()
-        self.headers = {'Authorization': 'Bearer ' + self._access_token}
+    def __init__(self, event: dict | None = None, profile: dict | None = None, output_prefix: str | None = None):
+        """
+        event is an optional Strava webhook event. When given, only that activity is refreshed in the local store
+        instead of syncing all new activities.
+        profile is an entry of the config's athletes list, used by batch mode to render another athlete.
+        output_prefix overrides where the images are written, e.g. serve's publish directory.
+        Strava data and the race calendar are only loaded when a screen first needs them
+        """
+        self._event = event
+        self._synced = False
 
         with open("config.yaml", "r") as f:
             config = yaml.safe_load(f)
@@ -32,112 +69,301 @@ class Strava:
                 self.regular_font_path = config.get("regular_font_path_linux")
             self._input_data = config.get("input_data")
             self._race_image_path = config.get("race_image_path")
+            self._activity_store_path = config.get("activity_store")
+            self._token_cache_path = config.get("token_cache")
+            self._credentials = None  # STRAVA_* env vars
+            self._output_prefix = config.get("output_prefix", "output/")
+            self._use_stats_endpoint = config.get("use_stats_endpoint", False)
+            self._zone_weeks = config.get("heart_rate_zone_weeks", 4)
+            self._device = config.get("device", {})
+            self._timezone = ZoneInfo(config.get("timezone", "America/New_York"))
+            fingerprints_path = config.get("render_fingerprints")
+            input_cache = config.get("input_cache")
+            tile_cache = config.get("tile_cache")
+            assets.disk_cache_dir = config.get("asset_cache")
+
+        if profile:
+            # Each athlete keeps their own store, token and render history under cache/<name>
+            cache_dir = profile.get("cache_dir", f"./cache/{profile['name']}")
+            self._athlete_id = profile["athlete_id"]
+            self.goals = profile.get("goals", self.goals)
+            self._input_data = profile.get("input_data", self._input_data)
+            self._race_image_path = profile.get("race_image_path", self._race_image_path)
+            self._output_prefix = profile.get("output_prefix", f"output/{profile['name']}_")
+            self._device = profile.get("device", self._device)
+            self._timezone = ZoneInfo(profile["timezone"]) if "timezone" in profile else self._timezone
+            self._activity_store_path = f"{cache_dir}/activities.db"
+            self._token_cache_path = f"{cache_dir}/token.json"
+            fingerprints_path = f"{cache_dir}/render_fingerprints.json"
+            tile_cache = f"{cache_dir}/tiles"
+            credentials_env = {"client_id": "STRAVA_CLIENT_ID", "client_secret": "STRAVA_CLIENT_SECRET",
+                               "refresh_token": f"{profile['name'].upper()}_STRAVA_REFRESH_TOKEN",
+                               **profile.get("credentials_env", {})}
+            self._credentials = {key: os.getenv(env) for key, env in credentials_env.items()}
+        self._fingerprints = fingerprint.FingerprintStore(fingerprints_path)
+        self._inputs = InputStore(self._input_data, input_cache)
+        self._tiles = tiles.TileCache(tile_cache)
+        if output_prefix:
+            self._output_prefix = output_prefix
+
+    @cached_property
+    def client(self):
+        with tracing.span("import strava client"):
+            from strava_client import client
+        return client
+
+    @cached_property
+    def headers(self) -> dict[str, str]:
+        with tracing.span("import strava client"):
+            import authenticate
+        with tracing.span("fetch token"):
+            access_token = authenticate.get_strava_access_token(
+                cache_path=self._token_cache_path or authenticate.TOKEN_CACHE_PATH, credentials=self._credentials
+            )
+        return {'Authorization': 'Bearer ' + access_token}
+
+    @cached_property
+    def _store(self):
+        from activity_store import ActivityStore
+        return ActivityStore(self._activity_store_path)
+
+    @cached_property
+    def activities(self) -> pandas.DataFrame:
+        with tracing.span("load activities"):
+            event = self._event
+            if event and event.get("object_type") == "activity" and self._store.last_start_date():
+                self.apply_activity_event(event)
+            elif not self._synced:
+                self.sync_activities()
+                self._synced = True
+            return self.get_activities()
+
+    @cached_property
+    def aggregate_index(self) -> aggregates.AggregateIndex:
+        with tracing.span("aggregate index"):
+            self.activities  # Synced first, so the totals include new activities
+            return aggregates.AggregateIndex(self._store.daily_totals())
+
+    @cached_property
+    def recent_stats(self) -> dict[str, float]:
+        """
+        Recent and year to date run and ride totals, from the local activity history unless the config asks for
+        Strava's athlete stats endpoint
+        """
+        if not self._use_stats_endpoint:
+            return self.aggregate_index.stats(self.local_now().date())
+        with tracing.span("fetch stats"):
+            return self.get_recent_stats()
+
+    @cached_property
+    def recent_routes(self) -> pandas.DataFrame:
+        self.activities  # Synced first, so the latest route is included
+        return self._store.recent_routes(10)
+
+    @cached_property
+    def heart_rate_zones(self) -> dict:
+        """
+        Time in each heart rate zone for the latest run with heart rate, and summed over the runs of the last
+        heart_rate_zone_weeks weeks. Only runs whose zones aren't stored yet are fetched
+        """
+        runs = self.activities[self.activities["type"].isin(aggregates.SPORT_GROUPS["run"])]
+        since = pandas.Timestamp(self.local_now()).normalize() - pandas.Timedelta(weeks=self._zone_weeks)
+        recent = runs[runs["start_date_local"] >= since]
+        if recent.empty:
+            recent = runs.head(1)
+        ids = recent["id"].tolist()
+        self.fetch_heart_rate_zones(ids)
+        zones = self._store.zones(ids)
+
+        with_zones = [activity_id for activity_id in ids if zones.get(activity_id)]
+        latest = None
+        if with_zones:
+            run = recent[recent["id"] == with_zones[0]].iloc[0]
+            latest = {"id": int(run["id"]), "start_date_local": run["start_date_local"].isoformat(),
+                      "distance": float(run["distance"]), "buckets": zones[with_zones[0]]}
+        # Zones are summed by position, their bpm ranges are those of the latest run
+        n_zones = max((len(zones[activity_id]) for activity_id in with_zones), default=0)
+        seconds = [sum(zones[activity_id][i]["time"] for activity_id in with_zones if i < len(zones[activity_id]))
+                   for i in range(n_zones)]
+        return {"latest": latest, "recent": {"runs": len(with_zones), "seconds": seconds}}
+
+    def load_heart_rate_zones(self, _=None) -> dict | None:
+        """
+        Loads the heart rate zones for the render graph. None when they can't be fetched, e.g. Strava is down,
+        so only the zones screen is skipped and the other screens still render
+        """
+        try:
+            return self.heart_rate_zones
+        except Exception as e:
+            print(f"Skipping zones screen, heart rate zones could not be loaded: {e!r}")
+            return None
+
+    @cached_property
+    def race_calendar(self) -> pandas.DataFrame:
+        return self._inputs.races
+
+    @cached_property
+    def _render_digest(self) -> str:
+        """
+        Part of every tile key, so editing the config, fonts, icons or drawing code redraws all panels
+        """
+        return fingerprint.fingerprint(self.render_inputs())
 
-        self.activities = self.get_activities()
-        self.recent_stats = self.get_recent_stats()
-        self.race_calendar = pandas.read_excel(self._input_data, sheet_name="race_calendar")
-
+    def load_summary_data(self) -> None:
+        """
+        Loads the activities and stats needed by the summary screen. Stats fetched from Strava don't depend on
+        the activity sync, so they are fetched while it runs
+        """
+        if not self._use_stats_endpoint:
+            self.recent_stats
+            return
+        self.headers  # Token is needed by both, fetch it once up front
+        recent_stats = self.client.submit(lambda: self.recent_stats)
+        self.activities
+        recent_stats.result()
+
+    @tracing.traced("sync activities")
+    def sync_activities(self, per_page: int=200, concurrent_pages: int=4) -> int:
+        """
+        Fetches the activities started after the sync cursor into the local store.
+        The first page is fetched alone, since most runs have only a handful of new activities. If it is full,
+        the following pages are fetched concurrent_pages at a time until a page comes back short.
+        Pages are stored as they arrive, so the cursor only moves past a round once all its pages are stored.
+        When a page fails, the next sync fetches that round again. Returns the number of activities fetched
+        """
+        after = self._store.sync_cursor()
+        pages = [1]
+        fetched = 0
+        while pages:
+            futures = [self.client.submit(self.store_activity_page, after=after, page=page, per_page=per_page) for page in pages]
+            results = [future.result() for future in futures]
+            fetched += sum(count for count, _ in results)
+            latest = max((latest for _, latest in results), default=0)
+            if latest:
+                self._store.set_sync_cursor(latest)
+            if any(count < per_page for count, _ in results):
+                break
+            pages = list(range(pages[-1] + 1, pages[-1] + 1 + concurrent_pages))
+        print(f"Synced {fetched} new activities")
+        return fetched
+
+    def store_activity_page(self, after: int, page: int, per_page: int, batch_size: int=50) -> tuple[int, int]:
+        """
+        Streams one page of activities into the store, batch_size activities at a time, so memory use doesn't grow
+        with per_page. Returns the number of activities on the page and the latest start date among them
+        """
+        from activity_store import to_epoch
+        param = {'after': after, 'per_page': per_page, 'page': page}
+        with self.client.get(self.urls["activities"], headers=self.headers, params=param, stream=True) as res:
+            res.raise_for_status()
+            count = 0
+            latest = 0
+            for batch in json_stream.batched(json_stream.iter_array(res.iter_content(chunk_size=64 * 1024)), batch_size):
+                self._store.upsert(batch)
+                count += len(batch)
+                latest = max(latest, *(to_epoch(activity["start_date"]) for activity in batch))
+        return count, latest
+
+    def apply_activity_event(self, event: dict) -> None:
+        """
+        Applies a single webhook create/update/delete event to the local store
+        """
+        activity_id = event["object_id"]
+        print(f"Applying {event['aspect_type']} event for activity {activity_id}")
+        if event["aspect_type"] == "delete":
+            self._store.delete(activity_id)
+            return
+
+        param = {'include_all_efforts': False}
+        res = self.client.get(f'{self.urls["individual_activity"]}/{activity_id}', headers=self.headers, params=param)
+        if res.status_code == 404:
+            # Activity is no longer visible to us, e.g. it was made private
+            self._store.delete(activity_id)
+            return
+        res.raise_for_status()
+        self._store.upsert([res.json()])
+
+    def owns_event(self, event: dict) -> bool:
+        """
+        Whether the webhook event is about one of this athlete's activities
+        """
+        return event.get("object_type") == "activity" and event.get("owner_id") == self._athlete_id
 
-    def get_activities(self, n: int=200) -> pandas.DataFrame:
+    def apply_events(self, events: list[dict], sync: bool=False) -> None:
+        """
+        Applies the athlete's webhook events to the store and drops the loaded data, so the next render reloads it
+        from the store. The activities are only synced from Strava again when sync is set.
+        Used by the render daemon, which keeps one Strava object between events
+        """
+        self.__dict__.pop("headers", None)  # Access tokens expire after six hours, the cached one is reused if valid
+        for event in events:
+            if self.owns_event(event):
+                self.apply_activity_event(event)
+        if sync:
+            self._synced = False
+        for name in ("activities", "aggregate_index", "recent_stats", "recent_routes", "heart_rate_zones"):
+            self.__dict__.pop(name, None)
+
+    def get_activities(self) -> pandas.DataFrame:
         """
-        Returns the last n activities
+        Returns the full activity history from the local store
         """
-        param = {'per_page': n, 'page': 1}
-        activities = requests.get(self.urls["activities"], headers=self.headers, params=param).json()
-        activities = pandas.json_normalize(activities)
-        return activities
+        return self._store.load()
 
     def get_latest_ids(self) -> dict[str, int]:
         """
         Returns the activity id of the latest run, ride
         TODO: Fetch latest race
         """
-        ids = self.activities.sort_values(by="start_date", ascending=False).groupby("sport_type")["id"].first()
+        ids = self.activities.sort_values(by="start_date", ascending=False).groupby("sport_type", observed=True)["id"].first()
         return ids[ids.index.isin(["Run", "VirtualRide"])].to_dict()
 
-    # def get_heart_rate_zones(self, activity_id: int) -> bytes:
-    #     zones = requests.get(f'{self.urls["individual_activity"]}/{activity_id}/zones', headers=self.headers).json()
-    #     zones = zones[0]['distribution_buckets']  # Filter for default heart rate zones
-    #     values = []
-    #     for zone in zones:
-    #         values.append(zone['time'])
-    #
-    #     colors = matplotlib.colors.LinearSegmentedColormap.from_list("light_to_dark_red", ["lightcoral", "darkred"], N=len(values))
-    #     segment_colors = [colors(i) for i in range(len(values))]
-    #     plt.figure(figsize=(8, 4.8))
-    #     plt.pie(values, colors=segment_colors, startangle=90, counterclock=False)
-    #
-    #     img_buffer = io.BytesIO()
-    #     plt.savefig(img_buffer, format="jpg", dpi=300)
-    #     # plt.savefig("output/pie_chart.jpg", format="jpg", dpi=300)
-    #     plt.close()
-    #     img_buffer.seek(0)
-    #
-    #     return img_buffer.getvalue()
+    @tracing.traced("fetch zones")
+    def fetch_heart_rate_zones(self, activity_ids: list[int]) -> int:
+        """
+        Fetches the heart rate zones of the activities that don't have them stored yet, concurrently.
+        The zones that were fetched are stored even if others fail, the first failure is then raised.
+        Zones Strava refused are stored as empty for UNAVAILABLE_ZONES_SECONDS only, in case the athlete
+        subscribes. Returns the number of activities fetched
+        """
+        missing = self._store.missing_zones(activity_ids)
+        futures = [self.client.submit(self.get_heart_rate_zones, activity_id) for activity_id in missing]
+        error = None
+        for activity_id, future in zip(missing, futures):
+            try:
+                buckets = future.result()
+                if buckets is None:
+                    self._store.add_zones(activity_id, [], expires_at=int(time.time()) + UNAVAILABLE_ZONES_SECONDS)
+                else:
+                    self._store.add_zones(activity_id, buckets)
+            except Exception as e:
+                error = error or e
+        if error:
+            raise error
+        return len(missing)
+
+    def get_heart_rate_zones(self, activity_id: int) -> list[dict] | None:
+        """
+        Returns the activity's heart rate zone buckets, empty if it was recorded without heart rate or has been
+        deleted, and None if the athlete's zones aren't available to us
+        """
+        res = self.client.get(f'{self.urls["individual_activity"]}/{activity_id}/zones', headers=self.headers)
+        # 402 and 403 when the athlete has no Summit subscription, which may change
+        if res.status_code in (402, 403):
+            return None
+        if res.status_code == 404:
+            return []
+        res.raise_for_status()
+        zones = next((zones for zones in res.json() if zones.get("type") == "heartrate"), None)
+        return zones["distribution_buckets"] if zones else []
 
     def get_recent_stats(self) -> dict[str, float]:
-        stats = requests.get(f'{self.urls["athlete_stats"]}/{self._athlete_id}/stats', headers=self.headers).json()
+        stats = self.client.get(f'{self.urls["athlete_stats"]}/{self._athlete_id}/stats', headers=self.headers).json()
         stats = pandas.json_normalize(stats)
         return stats.iloc[0].to_dict()
 
 
-    # @staticmethod
-    # def get_polyline(details) -> bytes:
-    #     summary_polyline = details["map"]["summary_polyline"]
-    #     decoded_polyline = polyline.decode(summary_polyline)
-    #     # start_latlng = details["start_latlng"]
-    #     # my_map = folium.Map(location=[start_latlng[0], start_latlng[1]], zoom_start=14)
-    #     # folium.PolyLine(decoded_polyline, color="blue", weight=2.5, opacity=1).add_to(my_map)
-    #     # my_map.save("output/polyline.html")
-    #
-    #     # Separate latitudes and longitudes
-    #     latitudes = [point[0] for point in decoded_polyline]
-    #     longitudes = [point[1] for point in decoded_polyline]
-    #     plt.figure(figsize=(6, 6))
-    #     plt.plot(longitudes, latitudes, linestyle='-', color='orange')
-    #
-    #     # Remove the borders (spines) and axes
-    #     plt.gca().get_xaxis().set_visible(False)
-    #     plt.gca().get_yaxis().set_visible(False)
-    #     for spine in plt.gca().spines.values():
-    #         spine.set_visible(False)
-    #
-    #     img_buffer = io.BytesIO()
-    #     plt.savefig(img_buffer, format="jpg", dpi=300)
-    #     # plt.savefig("output/polyline.jpg", format="jpg", dpi=300)
-    #     plt.close()
-    #     img_buffer.seek(0)
-    #
-    #     return img_buffer.getvalue()
-
-
-    # def get_detailed_run(self) -> None:
-    #     run_id = self.get_latest_ids()["Run"]
-    #
-    #     param = {'include_all_efforts': False}
-    #     # run_id = 13226803155  # Not treadmill
-    #     heart_rate_zone_bytes = self.get_heart_rate_zones(activity_id=run_id)
-    #     details = requests.get(f'{self.urls["individual_activity"]}/{run_id}', headers=self.headers, params=param).json()
-    #     if details["map"]:
-    #         polyline_bytes = self.get_polyline(details=details)
-    #
-    #         polyline_buffer = io.BytesIO(polyline_bytes)
-    #         heart_rate_zone_buffer = io.BytesIO(heart_rate_zone_bytes)
-    #
-    #         polyline_buffer.seek(0)
-    #         heart_rate_zone_buffer.seek(0)
-    #
-    #         polyline_image = Image.open(polyline_buffer)
-    #         heart_rate_zone = Image.open(heart_rate_zone_buffer)
-    #         new_width = polyline_image.width + heart_rate_zone.width
-    #         new_height = max(polyline_image.height, heart_rate_zone.height)
-    #
-    #         screen = Image.new('RGB', (new_width, new_height))
-    #         screen.paste(polyline_image, (0, 0))
-    #         screen.paste(heart_rate_zone, (polyline_image.width, 0))
-    #         resized_screen = screen.resize((800, 480), Image.Resampling.LANCZOS)
-    #         resized_screen.save("output/screen1.jpg", format="JPEG", quality=70, progressive=False)
-
+    @tracing.traced("progress ring")
     def progress_ring(self, image: Image, center: tuple, outer_radius: float, progress: float, icon: str) -> None:
         """
         Generates a progress ring based on the progress % with the icon in the middle
@@ -155,58 +381,105 @@ class Strava:
                   center[1] + outer_radius],
                  start=start_angle, end=end_angle, fill="limegreen", width=20)
 
-        icon_img = Image.open(self.icons[icon]).resize((outer_radius+20, outer_radius+20))
+        icon_img = assets.get_image(self.icons[icon], size=(outer_radius+20, outer_radius+20))
         image.paste(icon_img, (center[0] - icon_img.width // 2, center[1] - icon_img.height // 2), icon_img)
 
 
+    def add_progress_panel(self, image: Image, icon: str, progress: float, lines: list[str]) -> None:
+        """
+        Pastes the progress ring and the three lines of progress text at the top of a summary half
+        """
+        def render():
+            panel = Image.new("RGB", (400, 180), "white")
+            draw = ImageDraw.Draw(panel)
+            self.progress_ring(panel, progress=progress, center=(100, 90), outer_radius=80, icon=icon)
+            for i, text in enumerate(lines):
+                self.create_text(draw=draw, text=text, position=(200, 60 + i * 30), font_size=16)
+            return panel
+
+        image.paste(self._tiles.get(f"{icon} panel", (progress, lines, self._render_digest), render), (0, 0))
+
+    @tracing.traced("create_text")
     def create_text(self, draw, text, position, font_size=30, color="black", bold=False, angle=0, base_image=None):
         """
         base_image only required for angle
         """
         if bold:
-            font = ImageFont.truetype(self.bold_font_path, font_size)
+            font = assets.get_font(self.bold_font_path, font_size)
         else:
-            font = ImageFont.truetype(self.regular_font_path, font_size)
+            font = assets.get_font(self.regular_font_path, font_size)
 
         if angle==0:
             draw.text(position, text, fill=color, font=font)
         else:
-            lines = text.split("\n")
-            line_spacing = 5
-            line_heights = [font.getbbox(line)[3] - font.getbbox(line)[1] for line in lines]
-            total_text_height = sum(line_heights) + (line_spacing * (len(lines) - 1))
-            max_text_width = max(font.getbbox(line)[2] - font.getbbox(line)[0] for line in lines)
-
-            # Create a transparent image with the required size
-            text_image = Image.new("RGBA", (max_text_width + 20, total_text_height + 20), (255, 255, 255, 0))
-            text_draw = ImageDraw.Draw(text_image)
-
-            # Draw each line at appropriate positions
-            y_offset = 0
-            for line in lines:
-                text_draw.text((0, y_offset), line, font=font, fill=color)
-                y_offset += (font.getbbox(line)[3] - font.getbbox(line)[1]) + line_spacing  # Line spacing
-
-            # Rotate the text image
-            rotated_text = text_image.rotate(angle, expand=True)
+            rotated_text = self.rotated_text(text, font, color, angle)
             # Paste the rotated text onto the original image
             base_image.paste(rotated_text, position, rotated_text)
 
     @staticmethod
-    def generate_weekly_data(data: pandas.DataFrame, n: int, metric: str) -> pandas.DataFrame :
+    def rotated_text(text, font, color, angle) -> Image:
+        """
+        Draws the text on a transparent image rotated by angle degrees
         """
-        Aggregate the data going back n weeks from today. Week starts from Monday and ensure missing weeks have a value 0
+        lines = text.split("\n")
+        line_spacing = 5
+        line_heights = [font.getbbox(line)[3] - font.getbbox(line)[1] for line in lines]
+        total_text_height = sum(line_heights) + (line_spacing * (len(lines) - 1))
+        max_text_width = max(font.getbbox(line)[2] - font.getbbox(line)[0] for line in lines)
+
+        # Create a transparent image with the required size
+        text_image = Image.new("RGBA", (max_text_width + 20, total_text_height + 20), (255, 255, 255, 0))
+        text_draw = ImageDraw.Draw(text_image)
+
+        # Draw each line at appropriate positions
+        y_offset = 0
+        for line in lines:
+            text_draw.text((0, y_offset), line, font=font, fill=color)
+            y_offset += (font.getbbox(line)[3] - font.getbbox(line)[1]) + line_spacing  # Line spacing
+
+        # Rotate the text image
+        return text_image.rotate(angle, expand=True)
+
+    def add_quote(self, image: Image, screen: str, position: tuple, max_line_length: int, font_size: int) -> None:
         """
-        data["start_date_local"] = pandas.to_datetime(data["start_date_local"])
-        data["week_start"] = data["start_date_local"].dt.tz_localize(None).dt.to_period("W-SUN").apply(lambda r: r.start_time)
-        weekly_data = data.groupby("week_start")[metric].sum().reset_index()
+        Pastes the screen's quote of the day, rotated, at position
+        """
+        wrapped_quote = self.wrap_text(self.get_quote(screen=screen), max_line_length=max_line_length)
+        font = assets.get_font(self.regular_font_path, font_size)
+        tile = self._tiles.get(f"{screen} quote", (wrapped_quote, font_size, self._render_digest),
+                               lambda: self.rotated_text(wrapped_quote, font, "black", angle=8))
+        image.paste(tile, position, tile)
+
+    @staticmethod
+    @tracing.traced("weekly aggregation")
+    def generate_weekly_data(data: pandas.DataFrame, n: int, metric: str | list[str],
+                             today: datetime | None=None) -> pandas.DataFrame :
+        """
+        Aggregate the data going back n weeks from today, or the given reference date. Week starts from Monday and
+        ensure missing weeks have a value 0. metric can be a list of columns, "count" gives the number of activities.
+        data is not modified
+        """
+        metrics = [metric] if isinstance(metric, str) else list(metric)
+        today = pandas.Timestamp(today) if today is not None else pandas.Timestamp.today()
+
+        dates = pandas.to_datetime(data["start_date_local"])
+        if dates.dt.tz is not None:
+            dates = dates.dt.tz_localize(None)
+        week_start = (dates - pandas.to_timedelta(dates.dt.weekday, unit="D")).dt.normalize()  # Floor to Monday
 
         # Get the latest n weeks including the current week
-        latest_week = pandas.Timestamp.today().normalize() - pandas.Timedelta(days=pandas.Timestamp.today().weekday())  # Monday of current week
+        latest_week = today.normalize() - pandas.Timedelta(days=today.weekday())  # Monday of current week
         earliest_week = latest_week - pandas.Timedelta(weeks=n-1)
-        all_weeks = pandas.date_range(start=earliest_week, end=latest_week, freq="W-MON")
-        weekly_data = weekly_data.set_index("week_start").reindex(all_weeks, fill_value=0).reset_index()
-        return weekly_data.rename(columns={"index": "week_start"})
+        in_window = (week_start >= earliest_week) & (week_start <= latest_week)
+
+        grouped = data.loc[in_window, [m for m in metrics if m != "count"]].groupby(week_start[in_window])
+        weekly_data = grouped.sum()
+        if "count" in metrics:
+            weekly_data["count"] = grouped.size()
+
+        all_weeks = pandas.date_range(start=earliest_week, end=latest_week, freq="7D")
+        weekly_data = weekly_data.reindex(all_weeks, fill_value=0)[metrics]
+        return weekly_data.rename_axis("week_start").reset_index()
 
     def generate_four_week_summary(self) -> list[list[str]]:
         """
@@ -222,46 +495,24 @@ class Strava:
         return result
 
 
+    @tracing.traced("line chart")
     def create_line_chart(self, image, weekly_data, position, size, metric, is_time):
-        fig, ax = plt.subplots(figsize=(size[0] / 100, size[1] / 100))
-
-        # Plot the data with an orange line and circular markers
-        ax.plot(weekly_data['week_start'], weekly_data[metric], marker='o', markersize=3, color='#ff6600', linewidth=2)
-        ax.fill_between(weekly_data['week_start'], weekly_data[metric], color='#ff6600', alpha=0.3)
-
-        # Set the y-axis to scale based on the highest value
         max_value = weekly_data[metric].max()
-        ax.set_ylim(0, max_value * 1.03)  # Add 3% buffer
-
-        # Formatting the x-axis to show only the beginning of the month
-        ax.xaxis.set_major_locator(mdates.MonthLocator())
-        ax.xaxis.set_major_formatter(mdates.DateFormatter('%b'))
-        ax.set_xlim(weekly_data['week_start'].min(), weekly_data['week_start'].max())
-
-        # Formatting the y-axis
-        ax.set_yticks([max_value / 2, max_value])
         if is_time:
-            ax.set_yticklabels([f"{self.format_time(max_value/2)}", f"{self.format_time(max_value)}"])
+            y_labels = (f"{self.format_time(max_value/2)}", f"{self.format_time(max_value)}")
         else:
-            ax.set_yticklabels([f"{max_value / 2:.1f} km", f"{max_value:.1f} km"])
-
-        # Customizing appearance
-        ax.spines['top'].set_visible(False)
-        ax.spines['right'].set_visible(False)
-        ax.spines['left'].set_color('white')
-        ax.spines['bottom'].set_color('white')
-        ax.tick_params(axis='x', colors="black", labelsize=8)
-        ax.tick_params(axis='y', colors="black", labelsize=6, pad=2)
-        ax.set_facecolor("white")
-        fig.patch.set_facecolor("white")
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png', bbox_inches='tight', facecolor="white")
-        buf.seek(0)
-        chart_img = Image.open(buf)
+            y_labels = (f"{max_value / 2:.1f} km", f"{max_value:.1f} km")
+
+        dates, values = weekly_data['week_start'].tolist(), weekly_data[metric].tolist()
+        chart_img = self._tiles.get(
+            f"{metric} chart", (dates, values, size, y_labels, self._render_digest),
+            lambda: charts.line_chart(dates=dates, values=values, size=size, y_labels=y_labels,
+                                      font_path=self.regular_font_path),
+        )
         image.paste(chart_img, position)
 
     def calculate_progress(self, ytd_finished, yearly_goal, is_time) -> str:
-        today = datetime.today()
+        today = self.local_now()
         day_of_year = today.timetuple().tm_yday
         total_days = 366 if today.year % 4 == 0 else 365
 
@@ -288,29 +539,24 @@ class Strava:
             Generate a running summary screen
             """
             image = Image.new("RGB", (400, 480), "white")
-            draw = ImageDraw.Draw(image)
 
             progress = self.recent_stats["ytd_run_totals.distance"] / self.goals["yearly_running_distance"] / 1000
-            self.progress_ring(image, progress=progress, center=(100, 90), outer_radius=80, icon="running_progress_shoe")
-
-            text = f"{(1-progress) * self.goals['yearly_running_distance']:,.1f}km to go"
-            self.create_text(draw=draw, text=text, position=(200, 60), font_size=16)
-
-            text = f"{self.recent_stats["ytd_run_totals.distance"]/1000:,.1f}km / {self.goals["yearly_running_distance"]:,.1f}km"
-            self.create_text(draw=draw, text=text, position=(200, 90), font_size=16)
-
-            text = self.calculate_progress(ytd_finished=self.recent_stats["ytd_run_totals.distance"]/1000, yearly_goal=self.goals["yearly_running_distance"], is_time=False)
-            self.create_text(draw=draw, text=text, position=(200, 120), font_size=16)
+            lines = [
+                f"{(1-progress) * self.goals['yearly_running_distance']:,.1f}km to go",
+                f"{self.recent_stats["ytd_run_totals.distance"]/1000:,.1f}km / {self.goals["yearly_running_distance"]:,.1f}km",
+                self.calculate_progress(ytd_finished=self.recent_stats["ytd_run_totals.distance"]/1000, yearly_goal=self.goals["yearly_running_distance"], is_time=False),
+            ]
+            self.add_progress_panel(image, icon="running_progress_shoe", progress=progress, lines=lines)
 
             #Add zigzags
-            zigzag = Image.open(self.icons["zigzag"]).resize((30, 30)).convert("RGBA")
+            zigzag = assets.get_image(self.icons["zigzag"], size=(30, 30), mode="RGBA")
             for x in range(10, 390, 30):
                 image.paste(zigzag, (x, 165), zigzag)
                 image.paste(zigzag, (x, 305), zigzag)
 
             # Generate data for line chart
-            run_history = self.activities.loc[self.activities["type"].isin(["Run"]), ["start_date_local", "distance"]]
-            weekly_summary = self.generate_weekly_data(data=run_history, n=12, metric="distance")
+            run_history = self.activities.loc[self.activities["type"].isin(aggregates.SPORT_GROUPS["run"]), ["start_date_local", "distance"]]
+            weekly_summary = self.generate_weekly_data(data=run_history, n=12, metric="distance", today=self.local_now())
             weekly_summary["distance"] /= 1000
             self.create_line_chart(image, weekly_summary, (20, 185), (370, 120), metric="distance", is_time=False)
 
@@ -322,47 +568,48 @@ class Strava:
             Generate a running summary screen
             """
             image = Image.new("RGB", (400, 480), "white")
-            draw = ImageDraw.Draw(image)
 
             progress = self.recent_stats["ytd_ride_totals.moving_time"] / self.goals["yearly_cycling_hours"] / 3600
-            self.progress_ring(image, progress=progress, center=(100, 90), outer_radius=80, icon="cycling_progress_bike")
-
-            text = f"{self.format_time( (1-progress) * self.goals['yearly_cycling_hours'] * 3600 )} to go"
-            self.create_text(draw=draw, text=text, position=(200, 60), font_size=16)
-
-            text = f"{self.format_time(self.recent_stats['ytd_ride_totals.moving_time'])} / {self.goals['yearly_cycling_hours']}h"
-            self.create_text(draw=draw, text=text, position=(200, 90), font_size=16)
-
-            text = self.calculate_progress(ytd_finished=self.recent_stats["ytd_ride_totals.moving_time"]/3600, yearly_goal=self.goals["yearly_cycling_hours"], is_time=True)
-            self.create_text(draw=draw, text=text, position=(200, 120), font_size=16)
+            lines = [
+                f"{self.format_time( (1-progress) * self.goals['yearly_cycling_hours'] * 3600 )} to go",
+                f"{self.format_time(self.recent_stats['ytd_ride_totals.moving_time'])} / {self.goals['yearly_cycling_hours']}h",
+                self.calculate_progress(ytd_finished=self.recent_stats["ytd_ride_totals.moving_time"]/3600, yearly_goal=self.goals["yearly_cycling_hours"], is_time=True),
+            ]
+            self.add_progress_panel(image, icon="cycling_progress_bike", progress=progress, lines=lines)
 
             #Add zigzags
-            zigzag = Image.open(self.icons["zigzag"]).resize((30, 30)).convert("RGBA")
+            zigzag = assets.get_image(self.icons["zigzag"], size=(30, 30), mode="RGBA")
             for x in range(10, 390, 30):
                 image.paste(zigzag, (x, 165), zigzag)
                 image.paste(zigzag, (x, 305), zigzag)
 
 
             # Generate data for line chart
-            ride_history = self.activities.loc[self.activities["type"].isin(["Ride", "VirtualRide"]), ["start_date_local", "moving_time"]]
-            weekly_summary = self.generate_weekly_data(data=ride_history, n=12, metric="moving_time")
+            ride_history = self.activities.loc[self.activities["type"].isin(aggregates.SPORT_GROUPS["ride"]), ["start_date_local", "moving_time"]]
+            weekly_summary = self.generate_weekly_data(data=ride_history, n=12, metric="moving_time", today=self.local_now())
             self.create_line_chart(image, weekly_summary, (20, 185), (370, 120), metric="moving_time", is_time=True)
 
             # image.save("output/ride_summary.jpg")
             return image
 
+    @tracing.traced("combined table")
     def add_combined_table(self, image, position) -> Image:
         """
         Draws a combined run and ride table on the given image at the specified position
         """
-        draw = ImageDraw.Draw(image)
         data = self.generate_four_week_summary()
-        font = ImageFont.truetype(self.bold_font_path, 13)
+        table = self._tiles.get("combined table", (data, self._render_digest), lambda: self.draw_table(data))
+        image.paste(table, position)
+        return image
 
+    def draw_table(self, data: list[list[str]]) -> Image:
         col_widths = [120, 100, 100]  # Widths of table columns
         row_height = 23  # Height of each row
 
-        x_start, y_start = position
+        image = Image.new("RGB", (sum(col_widths) + 1, (len(data) + 1) * row_height + 1), "white")
+        draw = ImageDraw.Draw(image)
+        font = assets.get_font(self.bold_font_path, 13)
+        x_start, y_start = 0, 0
 
         # Draw table headers
         headers = ["", "Runs", "Rides"]
@@ -391,9 +638,20 @@ class Strava:
 
         return image
 
-    def get_quote(self) -> str:
-        quotes = pandas.read_excel(self._input_data, sheet_name="quotes")
-        return quotes.sample(n=1)["quote"].iloc[0]
+    def get_quote(self, screen: str) -> str:
+        """
+        Picks a quote that stays the same for the whole day, so re-renders on the same day are identical
+        """
+        quotes = self._inputs.quotes
+        seed = zlib.crc32(f"{self.local_now().date()}:{screen}".encode())
+        return quotes[seed % len(quotes)]
+
+    def local_now(self) -> datetime:
+        """
+        The athlete's wall-clock time, naive like start_date_local, which the daily totals and weekly charts are
+        bucketed by. The runner's clock is UTC, which is a day ahead late in the evening in the Americas
+        """
+        return datetime.now(tz=self._timezone).replace(tzinfo=None)
 
     @staticmethod
     def get_run_time() -> str:
@@ -409,9 +667,13 @@ class Strava:
         """
         Combines run and ride summaries
         """
-        run_summary = self.generate_run_summary_screen()
-        ride_summary = self.generate_ride_summary_screen()
+        self.load_summary_data()
+        self.compose_summary_screen(self.generate_run_summary_screen(), self.generate_ride_summary_screen())
 
+    def compose_summary_screen(self, run_summary: Image, ride_summary: Image) -> None:
+        """
+        Pastes the run and ride halves side by side and adds the shared four-week table, quote and run time
+        """
         combined_width = run_summary.width + ride_summary.width
         combined_height = max(run_summary.height, ride_summary.height)
 
@@ -427,36 +689,65 @@ class Strava:
         self.add_combined_table(image=combined_summary, position=(15, 350))
 
         # Add motivational quote
-        wrapped_quote = self.wrap_text(self.get_quote(), max_line_length=40)
-        self.create_text(draw=draw, text=wrapped_quote, position=(340, 330), font_size=22, angle=8, base_image=combined_summary)
+        self.add_quote(combined_summary, screen="summary", position=(340, 330), max_line_length=40, font_size=22)
 
         # Add run time
         self.create_text(draw=draw, text=self.get_run_time(), position=(560, 450), font_size=9)
 
-        combined_summary.save("output/combined_summary.jpg", format="JPEG")
+        self.save_screen(combined_summary, "summary")
 
     def race_calendar_screen(self) -> None:
         """
         Prints at most 3 upcoming races as well as the most recent completed race that has a strava post
         """
         # Load race calendar
-        today = datetime.today()
-        upcoming_races = self.race_calendar[self.race_calendar['date'] >= today].sort_values('date').head(3)
-        past_races = self.race_calendar[(self.race_calendar['date'] < today) & (self.race_calendar['strava_event'] != "No")].sort_values('date', ascending=False).head(1)
+        today = self.local_now()
+        upcoming_races = self._inputs.upcoming_races(today, n=3)
+        past_race = self._inputs.latest_posted_race(today)
 
         # Create image
         image = Image.new("RGB", (800, 480), "white")
         draw = ImageDraw.Draw(image)
-        calendar_icon = Image.open(self.icons["calendar"]).resize((15, 15))
-        location_icon = Image.open(self.icons["location"]).resize((15, 15))
-        goal_icon = Image.open(self.icons["goal"]).resize((15, 15))
 
-        self.create_text(draw, "Upcoming Races!!", (65, 10), font_size=25, bold=True)
         # Display upcoming races on the left half
+        race_images = fingerprint.directory_digest(self._race_image_path)
+        race_list = self._tiles.get("race list", (upcoming_races, today.date(), race_images, self._render_digest),
+                                    lambda: self.draw_race_list(upcoming_races, today))
+        image.paste(race_list, (0, 0))
+        y_position = race_list.height
+
+        # Add race quote
+        self.add_quote(image, screen="race", position=(20, y_position-20), max_line_length=45, font_size=20)
+
+        # Display most recent race on the right half
+        if past_race is not None:
+            try:
+                # Resized photos are kept by the asset cache
+                strava_img = assets.get_image(f"{self._race_image_path}/{past_race['strava_event']}.jpeg", size=(300, 450))
+                image.paste(strava_img, (470, 20))
+            except:
+                self.create_text(draw, "No Strava post available", (600, 280), font_size=20)
+
+        # Add run time
+        self.create_text(draw=draw, text=self.get_run_time(), position=(80, 460), font_size=9)
+        # Save and return the image
+        self.save_screen(image, "race")
+
+    def draw_race_list(self, upcoming_races: pandas.DataFrame, today: datetime) -> Image:
+        """
+        Title and upcoming races, as wide as the screen and as tall as the list
+        """
+        image = Image.new("RGB", (800, 50 + 105 * len(upcoming_races)), "white")
+        draw = ImageDraw.Draw(image)
+        calendar_icon = assets.get_image(self.icons["calendar"], size=(15, 15))
+        location_icon = assets.get_image(self.icons["location"], size=(15, 15))
+        goal_icon = assets.get_image(self.icons["goal"], size=(15, 15))
+
+        self.create_text(draw, "Upcoming Races!!", (65, 10), font_size=25, bold=True)
         y_position = 50
         for _, race in upcoming_races.iterrows():
             try:
-                logo = Image.open(f"{self._race_image_path}/{race['logo']}.JPG").resize((100, 100))
+                logo = assets.get_image(f"{self._race_image_path}/{race['logo']}.JPG", size=(100, 100))
                 image.paste(logo, (22, y_position))
             except:
                 self.create_text(draw, "Logo", (22, y_position), font_size=20)
@@ -474,28 +765,296 @@ class Strava:
             self.create_text(draw, f" {race['goal']}", (142, y_position + 69), font_size=14)
 
             y_position += 105
+        return image
 
-        # Add race quote
-        wrapped_quote = self.wrap_text(self.get_quote(), max_line_length=45)
-        self.create_text(draw=draw, text=wrapped_quote, position=(20, y_position-20), font_size=20, angle=8, base_image=image)
 
-        # Display most recent race on the right half
-        if not past_races.empty:
-            past_race = past_races.iloc[0]
-            try:
-                strava_img = Image.open(f"{self._race_image_path}/{past_race['strava_event']}.jpeg").resize((300, 450))
-                image.paste(strava_img, (470, 20))
-            except:
-                self.create_text(draw, "No Strava post available", (600, 280), font_size=20)
+    def routes_screen(self) -> None:
+        """
+        The latest route drawn large on the left and a grid of the nine routes before it on the right
+        """
+        image = Image.new("RGB", (800, 480), "white")
+        draw = ImageDraw.Draw(image)
+        self.create_text(draw, "Recent routes", (20, 10), font_size=25, bold=True)
+        if self.recent_routes.empty:
+            self.create_text(draw, "No routes yet", (20, 60), font_size=20)
+
+        for i, route in enumerate(self.recent_routes.itertuples()):
+            if i == 0:
+                size, position, width, font_size = (380, 370), (10, 50), 3, 16
+            else:
+                row, col = divmod(i - 1, 3)
+                size, position, width, font_size = (120, 105), (410 + col * 128, 50 + row * 135), 2, 11
+            thumbnail = self._tiles.get(
+                f"route {route.id} {size[0]}", (route.summary_polyline, size, width, self._render_digest),
+                lambda: route_map.route_thumbnail(route.summary_polyline, size, width=width),
+            )
+            image.paste(thumbnail, position)
+            label = f"{route.type}, {route.start_date_local.strftime('%b %d')}, {route.distance / 1000:,.1f}km"
+            self.create_text(draw, label, (position[0] + 5, position[1] + size[1] + 3), font_size=font_size)
+        self._tiles.prune("route ", {f"route {route.id} {size}" for route in self.recent_routes.itertuples()
+                                     for size in (380, 120)})
 
         # Add run time
-        self.create_text(draw=draw, text=self.get_run_time(), position=(80, 460), font_size=9)
-        # Save and return the image
-        image.save("output/race_calendar.jpg")
+        self.create_text(draw=draw, text=self.get_run_time(), position=(560, 460), font_size=9)
+        self.save_screen(image, "routes")
+
+    def heart_rate_zones_screen(self) -> None:
+        """
+        Time in heart rate zones as pies, for the latest run on the left and the last few weeks of runs on the right
+        """
+        zones = self.heart_rate_zones
+        latest = zones["latest"]
+        image = Image.new("RGB", (800, 480), "white")
+        draw = ImageDraw.Draw(image)
+        self.create_text(draw, "Heart rate zones", (20, 10), font_size=25, bold=True)
+
+        if latest is None:
+            self.create_text(draw, "No runs with heart rate yet", (20, 60), font_size=20)
+        else:
+            title = f"Latest run, {datetime.fromisoformat(latest['start_date_local']).strftime('%b %d')}, {latest['distance'] / 1000:,.1f}km"
+            self.add_zone_pie(image, title, [bucket["time"] for bucket in latest["buckets"]], latest["buckets"], x=0)
+            title = f"Last {self._zone_weeks} weeks, {zones['recent']['runs']} runs"
+            self.add_zone_pie(image, title, zones["recent"]["seconds"], latest["buckets"], x=400)
+
+        # Add run time
+        self.create_text(draw=draw, text=self.get_run_time(), position=(560, 460), font_size=9)
+        self.save_screen(image, "zones")
+
+    def add_zone_pie(self, image: Image, title: str, seconds: list[float], buckets: list[dict], x: int) -> None:
+        """
+        Draws a titled pie of the time in each zone with its legend, in the half of the screen starting at x
+        """
+        draw = ImageDraw.Draw(image)
+        self.create_text(draw, title, (x + 20, 55), font_size=18, bold=True)
+        image.paste(charts.pie_chart(seconds, diameter=200), (x + 20, 100))
+
+        total = sum(seconds) or 1
+        for i, (time_in_zone, color) in enumerate(zip(seconds, charts.zone_colors(len(seconds)))):
+            label = f"Z{i + 1}"
+            if i < len(buckets):
+                low, high = buckets[i]["min"], buckets[i]["max"]
+                label += f" {low}+ bpm" if high == -1 else f" <{high} bpm" if low == 0 else f" {low}-{high} bpm"
+            y = 105 + i * 40
+            draw.rectangle([x + 235, y, x + 251, y + 16], fill=color)
+            self.create_text(draw, label, (x + 257, y), font_size=13, bold=True)
+            self.create_text(draw, f"{self.format_time(time_in_zone)} ({time_in_zone / total:.0%})", (x + 257, y + 17),
+                             font_size=12)
+
+    def save_screen(self, image: Image, screen: str) -> None:
+        """
+        Saves the screen as a JPEG and as the Inky Frame's pre-dithered .bin
+        """
+        path = f"{self._output_prefix}{SCREEN_FILES[screen]}"
+        with tracing.span("save jpeg", screen=screen):
+            image.save(f"{path}.jpg", format="JPEG")
+        with tracing.span("inky export", screen=screen):
+            inky_export.export(image, path)
+
+    def summary_fingerprint(self) -> str:
+        """
+        Hash of everything the summary screen is drawn from, apart from the run time stamp
+        """
+        return fingerprint.fingerprint(
+            "summary", self.local_now().date(), self.activities, self.recent_stats, self.goals, self.render_inputs(),
+            self._inputs.digest,
+        )
+
+    def race_fingerprint(self) -> str:
+        """
+        Hash of everything the race calendar screen is drawn from, apart from the run time stamp
+        """
+        return fingerprint.fingerprint(
+            "race", self.local_now().date(), self.race_calendar, self.render_inputs(),
+            self._inputs.digest, fingerprint.directory_digest(self._race_image_path),
+        )
+
+    def routes_fingerprint(self) -> str:
+        """
+        Hash of everything the routes screen is drawn from, apart from the run time stamp
+        """
+        return fingerprint.fingerprint("routes", self.recent_routes, self.render_inputs())
+
+    def zones_fingerprint(self) -> str:
+        """
+        Hash of everything the heart rate zones screen is drawn from, apart from the run time stamp
+        """
+        return fingerprint.fingerprint("zones", self.heart_rate_zones, self.render_inputs())
+
+    def render_inputs(self) -> dict[str, str]:
+        """
+        Digests of the config, fonts, icons and drawing code shared by every screen
+        """
+        paths = ["config.yaml", self.bold_font_path, self.regular_font_path, *self.icons.values(),
+                 __file__, charts.__file__, assets.__file__, inky_export.__file__, tiles.__file__, route_map.__file__]
+        return {path: fingerprint.file_digest(path) for path in paths}
+
+    def render(self, screens: list[str], force: bool=False) -> list[str]:
+        """
+        Renders the requested screens ("summary", "race", "routes", "zones") whose inputs changed since they were last rendered,
+        or all of them when force is set. Returns the screens that were rendered, and "manifest" when the
+        published manifest changed apart from its timestamps.
+        Data loading, the run and ride halves and the race calendar run concurrently, each as soon as its
+        inputs are ready
+        """
+        # Load the data for every requested screen, so their fingerprints can be checked
+        data = RenderGraph()
+        if {"summary", "routes", "zones"} & set(screens):
+            data.add("token", lambda: self.headers)
+            data.add("activities", lambda _: self.activities, deps=("token",))
+        if "summary" in screens:
+            data.add("stats", lambda _: self.recent_stats, deps=("token" if self._use_stats_endpoint else "activities",))
+        if "race" in screens:
+            data.add("race calendar", lambda: self.race_calendar)
+        if "routes" in screens:
+            data.add("routes", lambda _: self.recent_routes, deps=("activities",))
+        if "zones" in screens:
+            data.add("zones", self.load_heart_rate_zones, deps=("activities",))
+        loaded = data.run()
+        if "zones" in screens and loaded["zones"] is None:
+            screens = [screen for screen in screens if screen != "zones"]
+
+        fingerprint_fns = {"summary": self.summary_fingerprint, "race": self.race_fingerprint,
+                           "routes": self.routes_fingerprint, "zones": self.zones_fingerprint}
+        fingerprints = {screen: fingerprint_fns[screen]() for screen in screens}
+        changed = [screen for screen in screens if force or not self._fingerprints.unchanged(screen, fingerprints[screen])]
+        for screen in set(screens) - set(changed):
+            print(f"Skipping {screen} screen, inputs unchanged since the last render")
+
+        graph = RenderGraph()
+        if "summary" in changed:
+            graph.add("run summary", self.generate_run_summary_screen)
+            graph.add("ride summary", self.generate_ride_summary_screen)
+            graph.add("summary screen", self.compose_summary_screen, deps=("run summary", "ride summary"))
+        if "race" in changed:
+            graph.add("race screen", self.race_calendar_screen)
+        if "routes" in changed:
+            graph.add("routes screen", self.routes_screen)
+        if "zones" in changed:
+            graph.add("zones screen", self.heart_rate_zones_screen)
+        graph.run()
+
+        for screen in changed:
+            output = fingerprint.file_digest(f"{self._output_prefix}{SCREEN_FILES[screen]}.bin")
+            self._fingerprints.record(screen, fingerprints[screen], output)
+        # Written on every render, skipped screens included, as the next wake moves on with the clock
+        if self.write_manifest(activities=loaded.get("activities")):
+            return [*changed, "manifest"]
+        return changed
+
+    def write_manifest(self, activities: pandas.DataFrame | None=None) -> bool:
+        """
+        Writes manifest.json next to the images, listing the device's screens that have been rendered with
+        their content hashes, when the frame should wake next and the quiet hours. Returns whether anything but
+        the generation time and next wake changed since the last manifest, i.e. whether it is worth publishing
+        """
+        screens = []
+        for screen in self._device.get("screens", list(SCREEN_FILES)):
+            output = self._fingerprints.output(screen)
+            if output:
+                # Published next to the manifest, under the same prefix, e.g. jane_combined_summary.bin
+                url = f"{self._device.get('base_url', '')}{os.path.basename(self._output_prefix)}{SCREEN_FILES[screen]}.bin"
+                screens.append({"name": screen, "url": url, "hash": output})
+        with tracing.span("write manifest"):
+            published = manifest.build_manifest(screens, self._device, activities)
+            manifest.write_manifest(f"{self._output_prefix}manifest.json", published)
+        # Kept with the screens' fingerprints, under a name that isn't a screen
+        digest = fingerprint.fingerprint({key: value for key, value in published.items()
+                                          if key not in ("generated_at", "next_wake")})
+        if self._fingerprints.unchanged("manifest", digest):
+            return False
+        self._fingerprints.record("manifest", digest)
+        return True
+
+
+def load_event() -> dict | None:
+    """
+    Returns the webhook event forwarded by the repository_dispatch payload, if any
+    """
+    event = json.loads(os.getenv("STRAVA_EVENT") or "null")
+    return event or None
+
+
+def render_batch(profiles: list[dict], screens: list[str], event: dict | None=None, force: bool=False,
+                 max_workers: int=4) -> tuple[list[str], list[str]]:
+    """
+    Renders every athlete profile concurrently. Fonts, icons and the Strava HTTP pool (and with it the rate
+    limit budget) are shared between athletes. An athlete that fails, e.g. with a revoked token, doesn't stop
+    the others. Returns the rendered screens as "<name>:<screen>" and the names of the athletes that failed
+    """
+    def render_profile(profile):
+        # A webhook event only concerns the athlete who owns the activity
+        athlete_event = event if event and event.get("owner_id") == profile["athlete_id"] else None
+        with tracing.span("athlete", name=profile["name"]):
+            try:
+                return Strava(event=athlete_event, profile=profile).render(screens, force=force)
+            except Exception as e:
+                print(f"Rendering for {profile['name']} failed: {e!r}")
+                traceback.print_exc()
+                return None
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="athlete") as executor:
+        results = list(executor.map(render_profile, profiles))
+    rendered = [f"{profile['name']}:{screen}" for profile, result in zip(profiles, results) for screen in result or []]
+    failed = [profile["name"] for profile, result in zip(profiles, results) if result is None]
+    return rendered, failed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate Strava summary images for the Inky Frame")
+    subparsers = parser.add_subparsers(dest="command")
+    render = subparsers.add_parser("render", help="Render screens to the output directory")
+    batch = subparsers.add_parser("batch", help="Render screens for every athlete in the config's athletes list")
+    serve = subparsers.add_parser("serve", help="Keep running and re-render on Strava webhook events")
+    for subparser in (render, batch, serve):
+        subparser.add_argument("screen", nargs="?", choices=["summary", "race", "routes", "zones", "all"], default="all")
+    for subparser in (render, batch):
+        subparser.add_argument("--force", action="store_true", help="Render even if the inputs are unchanged")
+        subparser.add_argument("--trace", metavar="DIR", help="Write an OTLP/JSON trace.json and a summary.json here")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8080)
+    serve.add_argument("--publish", metavar="DIR", help="Write the images here instead of the configured output_prefix")
+    serve.add_argument("--debounce", type=float, default=2.0, help="Seconds to wait for further events before rendering")
+    serve.add_argument("--refresh-interval", type=float, default=3600,
+                       help="Seconds between re-renders when no events arrive, for the date-dependent parts")
+    args = parser.parse_args()
+    screen = args.screen if args.command else "all"
+    screens = ["summary", "race", "routes", "zones"] if screen == "all" else [screen]
+    force = args.command in ("render", "batch") and args.force
+
+    if args.command == "serve":
+        from render_daemon import serve
+        if args.publish:
+            os.makedirs(args.publish, exist_ok=True)
+        obj = Strava(output_prefix=os.path.join(args.publish, "") if args.publish else None)
+        serve(obj, screens, host=args.host, port=args.port, debounce=args.debounce,
+              refresh_interval=args.refresh_interval)
+        return
+
+    if args.command == "batch":
+        with open("config.yaml", "r") as f:
+            config = yaml.safe_load(f)
+        rendered, failed = render_batch(config.get("athletes", []), screens, event=load_event(), force=force,
+                                        max_workers=config.get("batch_workers", 4))
+    else:
+        obj = Strava(event=load_event())
+        rendered, failed = obj.render(screens, force=force), []
+
+    # Lets the workflow skip publishing when nothing was re-rendered and the manifest is unchanged
+    if os.getenv("GITHUB_OUTPUT"):
+        with open(os.environ["GITHUB_OUTPUT"], "a") as f:
+            f.write(f"changed={'true' if rendered else 'false'}\n")
+
+    print(assets.cache_report())
+    print(tiles.cache_report())
+    print("Timings:\n" + tracing.format_summary())
+    if args.command in ("render", "batch") and args.trace:
+        tracing.write_trace(os.path.join(args.trace, "trace.json"))
+        tracing.write_summary(os.path.join(args.trace, "summary.json"))
+    if failed:
+        # After the outputs above, so the athletes that did render are still published
+        sys.exit(f"Rendering failed for {', '.join(failed)}")
+    print("Done")
 
 
 if __name__ == "__main__":
-    obj = Strava()
-    obj.summary_screen()
-    obj.race_calendar_screen()
-    print("Done")
\ No newline at end of file
+    main()
@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+
+@pytest.fixture
+def strava(tmp_path, monkeypatch):
+    """
+    Strava object for the default athlete, reading config.yaml from the repository root but keeping its store,
+    render history, tiles and output in tmp_path. Uses the fonts bundled in ./fonts, so no system fonts are
+    needed. Set .client to a fake before it touches the network
+    """
+    import fingerprint
+    import tiles
+    from input_store import InputStore
+    from summary_screen import Strava
+
+    monkeypatch.chdir(REPO_ROOT)
+    (tmp_path / "output").mkdir()
+    obj = Strava(output_prefix=str(tmp_path / "output") + os.sep)
+    obj.bold_font_path = "./fonts/DejaVuSans-Bold.ttf"
+    obj.regular_font_path = "./fonts/LiberationSans-Bold.ttf"
+    obj._activity_store_path = str(tmp_path / "activities.db")
+    obj._fingerprints = fingerprint.FingerprintStore(str(tmp_path / "render_fingerprints.json"))
+    obj._tiles = tiles.TileCache(None)
+    obj._inputs = InputStore(obj._input_data, str(tmp_path / "inputs"))
+    obj.headers = {"Authorization": "Bearer test"}
+    return obj
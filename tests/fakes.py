@@ -0,0 +1,92 @@
+import json
+from concurrent.futures import Future
+from datetime import datetime, timedelta, timezone
+
+import requests
+
+
+def make_activities(n: int, start: datetime=datetime(2025, 1, 1, 7, tzinfo=timezone.utc)) -> list[dict]:
+    """
+    n runs one day apart, in the shape /athlete/activities returns them
+    """
+    activities = []
+    for i in range(n):
+        start_date = start + timedelta(days=i)
+        activities.append({
+            "id": 1000 + i,
+            "type": "Run",
+            "sport_type": "Run",
+            "start_date": start_date.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "start_date_local": (start_date - timedelta(hours=5)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "distance": 5000.0 + i,
+            "moving_time": 1500,
+            "elapsed_time": 1600,
+            "total_elevation_gain": 20.0,
+            "map": {"summary_polyline": None},
+        })
+    return activities
+
+
+class FakeResponse:
+    def __init__(self, body, status_code: int=200, chunk_size: int=7):
+        self.status_code = status_code
+        self._content = json.dumps(body).encode()
+        self._chunk_size = chunk_size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error", response=self)
+
+    def json(self):
+        return json.loads(self._content)
+
+    def iter_content(self, chunk_size: int=1):
+        # Small chunks, so values are split across them
+        for i in range(0, len(self._content), self._chunk_size):
+            yield self._content[i:i + self._chunk_size]
+
+
+class FakeClient:
+    """
+    Stands in for strava_client.client. routes maps a URL suffix to a function of the request params returning
+    a FakeResponse, or raising to simulate a failed request. Submitted calls run straight away
+    """
+    def __init__(self, routes: dict):
+        self.routes = routes
+        self.calls = []
+
+    def get(self, url: str, params: dict | None=None, **kwargs) -> FakeResponse:
+        self.calls.append((url, params))
+        for suffix, respond in self.routes.items():
+            if url.endswith(suffix):
+                return respond(params or {})
+        return FakeResponse({"message": "Record Not Found"}, status_code=404)
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+def activity_pages(activities: list[dict], failing_pages: set[int]=frozenset()):
+    """
+    /athlete/activities over the given activities: after filters on start_date, pages are in start date order
+    """
+    def respond(params: dict) -> FakeResponse:
+        page, per_page = params["page"], params["per_page"]
+        if page in failing_pages:
+            return FakeResponse({"message": "Internal Server Error"}, status_code=500)
+        after = params["after"]
+        selected = [activity for activity in activities
+                    if datetime.fromisoformat(activity["start_date"].replace("Z", "+00:00")).timestamp() > after]
+        return FakeResponse(selected[(page - 1) * per_page:page * per_page])
+    return respond
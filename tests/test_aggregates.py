@@ -0,0 +1,113 @@
+import random
+from datetime import date, datetime, timedelta, timezone
+
+import pandas
+import pytest
+
+import summary_screen
+from activity_store import ActivityStore
+from aggregates import EPOCH, METRICS, SPORT_GROUPS, AggregateIndex
+from fakes import FakeClient, activity_pages, make_activities
+
+
+def random_activities(n: int, seed: int=0) -> list[dict]:
+    rng = random.Random(seed)
+    activities = make_activities(n, start=datetime(2024, 1, 1, tzinfo=timezone.utc))
+    for activity in activities:
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(minutes=rng.randint(0, 800 * 24 * 60))
+        activity["start_date"] = start.strftime("%Y-%m-%dT%H:%M:%SZ")
+        activity["start_date_local"] = (start - timedelta(hours=5)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        activity["type"] = rng.choice(["Run", "Ride", "VirtualRide", "Walk"])
+        activity["distance"] = rng.uniform(1000, 40000)
+        activity["moving_time"] = rng.randint(600, 7200)
+        activity["elapsed_time"] = activity["moving_time"] + rng.randint(0, 600)
+        activity["total_elevation_gain"] = rng.uniform(0, 500)
+    return activities
+
+
+def expected_totals(store: ActivityStore, group: str, start: date, end: date) -> dict[str, float]:
+    activities = store.load()
+    day = activities["start_date_local"].dt.date
+    rows = activities[activities["type"].isin(SPORT_GROUPS[group]) & (day >= start) & (day <= end)]
+    return {"count": len(rows), "distance": rows["distance"].sum(), "moving_time": rows["moving_time"].sum(),
+            "elapsed_time": rows["elapsed_time"].sum(), "elevation_gain": rows["total_elevation_gain"].sum()}
+
+
+def assert_totals_match(store: ActivityStore, windows) -> None:
+    index = AggregateIndex(store.daily_totals())
+    for group in SPORT_GROUPS:
+        for start, end in windows:
+            totals = index.totals(group, start, end)
+            for metric, value in expected_totals(store, group, start, end).items():
+                assert totals[metric] == pytest.approx(value, rel=1e-5), (group, start, end, metric)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ActivityStore(str(tmp_path / "activities.db"))
+    yield store
+    store.close()
+
+
+WINDOWS = [(date(2024, 1, 1), date(2026, 3, 10)), (date(2025, 2, 3), date(2025, 3, 2)), (date(2025, 6, 1), date(2025, 6, 1)),
+           (EPOCH, date(2023, 1, 1)), (date(2026, 1, 1), date(2027, 1, 1))]
+
+
+def test_prefix_sums_match_the_activities(store):
+    store.upsert(random_activities(500))
+    assert_totals_match(store, WINDOWS)
+
+
+def test_triggers_follow_replaces_and_deletes(store):
+    activities = random_activities(300)
+    store.upsert(activities)
+    # INSERT OR REPLACE with a changed type, date and distance, then deletes
+    changed = random_activities(100, seed=1)
+    for activity, original in zip(changed, activities[:100]):
+        activity["id"] = original["id"]
+    store.upsert(changed)
+    for activity in activities[150:200]:
+        store.delete(activity["id"])
+    assert_totals_match(store, WINDOWS)
+    assert (store.daily_totals()["count"] > 0).all()
+
+
+def test_existing_store_is_backfilled(tmp_path):
+    path = str(tmp_path / "activities.db")
+    store = ActivityStore(path)
+    store.upsert(random_activities(200))
+    store._conn.execute("DROP TABLE daily_totals")
+    store.close()
+
+    store = ActivityStore(path)
+    assert_totals_match(store, WINDOWS)
+    store.close()
+
+
+def test_stats_windows():
+    daily_totals = pandas.DataFrame({
+        "day": [(date(2025, 12, 8) - EPOCH).days, (date(2026, 1, 2) - EPOCH).days, (date(2026, 1, 3) - EPOCH).days],
+        "type": ["Run", "Ride", "Run"],
+        **{metric: [1.0, 1.0, 1.0] for metric in METRICS},
+    })
+    stats = AggregateIndex(daily_totals).stats(date(2026, 1, 4))
+    assert stats["recent_run_totals.count"] == 2
+    assert stats["ytd_run_totals.count"] == 1
+    assert stats["ytd_ride_totals.count"] == 1
+    assert stats["all_run_totals.count"] == 2
+
+
+def test_today_is_the_athletes_local_date(strava, monkeypatch):
+    class UTCEvening(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            # 03:00 UTC on January 5th is still the evening of the 4th in New York
+            return datetime(2026, 1, 5, 3, tzinfo=timezone.utc).astimezone(tz)
+    monkeypatch.setattr(summary_screen, "datetime", UTCEvening)
+
+    # 27 days before the athlete's today, the start of the 4-week window, but 28 before the runner's
+    run = make_activities(1, start=datetime(2025, 12, 8, 17, tzinfo=timezone.utc))
+    strava.client = FakeClient({"/athlete/activities": activity_pages(run)})
+    strava._timezone = summary_screen.ZoneInfo("America/New_York")
+    assert strava.local_now() == datetime(2026, 1, 4, 22)
+    assert strava.recent_stats["recent_run_totals.count"] == 1
@@ -0,0 +1,47 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+import assets
+
+
+def test_disk_cache_counts_every_lookup_across_threads(tmp_path, monkeypatch):
+    source = tmp_path / "icon.png"
+    Image.new("RGB", (64, 64), "red").save(source)
+    monkeypatch.setattr(assets, "disk_cache_dir", str(tmp_path / "cache"))
+    monkeypatch.setattr(assets, "_disk_stats", {"hits": 0, "misses": 0})
+
+    sizes = [(size, size) for size in range(1, 401)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        images = list(executor.map(lambda size: assets.get_image(str(source), size), sizes))
+    assert [image.size for image in images] == sizes
+    assert assets._disk_stats == {"hits": 0, "misses": 400}
+
+    assets._load_image.cache_clear()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda size: assets.get_image(str(source), size), sizes))
+    assert assets._disk_stats == {"hits": 400, "misses": 400}
+
+
+def test_disk_cache_follows_content_not_mtime(tmp_path, monkeypatch):
+    source = tmp_path / "icon.png"
+    cache = tmp_path / "cache"
+    Image.new("RGB", (64, 64), "red").save(source)
+    monkeypatch.setattr(assets, "disk_cache_dir", str(cache))
+    monkeypatch.setattr(assets, "_disk_stats", {"hits": 0, "misses": 0})
+    assets._load_image.cache_clear()
+
+    assets.get_image(str(source), (32, 32))
+    # A fresh checkout: same content, new mtime
+    os.utime(source, (1, 1))
+    assets._load_image.cache_clear()
+    assert assets.get_image(str(source), (32, 32)).getpixel((0, 0)) == (255, 0, 0)
+    assert assets._disk_stats == {"hits": 1, "misses": 1}
+
+    # Edited asset: the resized copy of the old version is replaced
+    Image.new("RGB", (64, 64), "blue").save(source)
+    os.utime(source, (2, 2))
+    assert assets.get_image(str(source), (32, 32)).getpixel((0, 0)) == (0, 0, 255)
+    assert assets._disk_stats == {"hits": 1, "misses": 2}
+    assert len(list(cache.glob("*.png"))) == 1
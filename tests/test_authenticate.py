@@ -0,0 +1,56 @@
+import threading
+
+import pytest
+import requests
+
+import authenticate
+from strava_client import StravaClient
+
+CREDENTIALS = {"client_id": "1", "client_secret": "secret", "refresh_token": "refresh"}
+
+
+def test_only_gets_are_retried():
+    retry = StravaClient().session.get_adapter("https://www.strava.com").max_retries
+    assert retry.is_retry("GET", 503)
+    assert not retry.is_retry("POST", 503)
+
+
+@pytest.mark.parametrize("error", [requests.ConnectionError("connection refused"),
+                                   requests.exceptions.RetryError("too many 503 error responses")])
+def test_unreachable_strava_gives_a_clear_error(tmp_path, monkeypatch, error):
+    def post(*args, **kwargs):
+        raise error
+    monkeypatch.setattr(authenticate.client, "post", post)
+
+    with pytest.raises(RuntimeError, match="Unable to reach Strava"):
+        authenticate.get_strava_access_token(str(tmp_path / "token.json"), CREDENTIALS)
+
+
+def test_athletes_refresh_their_tokens_concurrently(tmp_path, monkeypatch):
+    # Both refreshes must be in flight at once to get past the barrier
+    barrier = threading.Barrier(2, timeout=5)
+
+    class Response:
+        ok = True
+
+        def json(self):
+            return {"access_token": "access", "refresh_token": "refresh", "expires_at": 2 ** 40}
+
+    def post(*args, **kwargs):
+        barrier.wait()
+        return Response()
+    monkeypatch.setattr(authenticate.client, "post", post)
+
+    errors = []
+
+    def refresh(name):
+        try:
+            authenticate.get_strava_access_token(str(tmp_path / name / "token.json"), CREDENTIALS)
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=refresh, args=(name,)) for name in ("jane", "john")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
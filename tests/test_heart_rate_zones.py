@@ -0,0 +1,64 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+from fakes import FakeClient, FakeResponse, activity_pages, make_activities
+
+BUCKETS = [{"min": 0, "max": 120, "time": 600}, {"min": 120, "max": 150, "time": 900}, {"min": 150, "max": -1, "time": 300}]
+
+
+def recent_runs(n: int=3) -> list[dict]:
+    return make_activities(n, start=datetime.now(timezone.utc) - timedelta(days=n + 1))
+
+
+def zones_route(status_code: int):
+    def respond(params: dict) -> FakeResponse:
+        if status_code != 200:
+            return FakeResponse({"message": "Payment Required"}, status_code=status_code)
+        return FakeResponse([{"type": "heartrate", "distribution_buckets": BUCKETS}])
+    return respond
+
+
+def zone_calls(client: FakeClient) -> int:
+    return sum(url.endswith("/zones") for url, _ in client.calls)
+
+
+def test_zones_are_summed_and_fetched_once(strava):
+    strava.client = FakeClient({"/athlete/activities": activity_pages(recent_runs()), "/zones": zones_route(200)})
+    zones = strava.heart_rate_zones
+    assert zones["latest"]["buckets"] == BUCKETS
+    assert zones["recent"] == {"runs": 3, "seconds": [1800, 2700, 900]}
+    assert zone_calls(strava.client) == 3
+
+    strava.__dict__.pop("heart_rate_zones")
+    strava.heart_rate_zones
+    assert zone_calls(strava.client) == 3
+
+
+def test_no_subscription_means_no_zones(strava):
+    strava.client = FakeClient({"/athlete/activities": activity_pages(recent_runs()), "/zones": zones_route(402)})
+    assert strava.heart_rate_zones == {"latest": None, "recent": {"runs": 0, "seconds": []}}
+
+    # Recorded as having no zones for now, so they aren't asked for again
+    strava.__dict__.pop("heart_rate_zones")
+    strava.heart_rate_zones
+    assert zone_calls(strava.client) == 3
+
+    # Once that expires they are, and picked up if the athlete subscribed meanwhile
+    strava._store._conn.execute("UPDATE heart_rate_zones SET expires_at = 0")
+    strava.client.routes["/zones"] = zones_route(200)
+    strava.__dict__.pop("heart_rate_zones")
+    assert strava.heart_rate_zones["recent"]["runs"] == 3
+    assert zone_calls(strava.client) == 6
+
+
+def test_zones_failure_only_skips_the_zones_screen(strava):
+    strava.client = FakeClient({"/athlete/activities": activity_pages(recent_runs()), "/zones": zones_route(500)})
+    assert strava.render(["summary", "race", "routes", "zones"], force=True) == ["summary", "race", "routes", "manifest"]
+    for name in ("combined_summary", "race_calendar", "routes"):
+        assert os.path.exists(f"{strava._output_prefix}{name}.bin")
+    assert not os.path.exists(f"{strava._output_prefix}heart_rate_zones.bin")
+
+    # Not recorded, so the next render asks again
+    strava.client.routes["/zones"] = zones_route(200)
+    strava.__dict__.pop("heart_rate_zones", None)
+    assert strava.render(["zones"]) == ["zones", "manifest"]
@@ -0,0 +1,144 @@
+import importlib
+import io
+import struct
+import sys
+import types
+import zlib
+
+import numpy
+import pytest
+from PIL import Image
+
+from inky_export import MAGIC, PALETTE, export, pack, quantize
+
+
+def unpack(data: bytes) -> numpy.ndarray:
+    assert data[:4] == MAGIC
+    width, height = struct.unpack("<HH", data[4:8])
+    packed = numpy.frombuffer(zlib.decompress(data[8:]), dtype=numpy.uint8).reshape(height, (width + 1) // 2)
+    pens = numpy.empty((height, packed.shape[1] * 2), dtype=numpy.uint8)
+    pens[:, 0::2] = packed >> 4
+    pens[:, 1::2] = packed & 0x0F
+    return pens[:, :width]
+
+
+def palette_blocks(width: int=70, height: int=20) -> Image.Image:
+    image = Image.new("RGB", (width, height))
+    block = width // len(PALETTE)
+    for pen, colour in enumerate(PALETTE):
+        image.paste(colour, (pen * block, 0, (pen + 1) * block, height))
+    return image
+
+
+def test_palette_colours_map_to_their_pens():
+    pens = numpy.asarray(quantize(palette_blocks()))
+    for pen in range(len(PALETTE)):
+        assert (pens[:, pen * 10:(pen + 1) * 10] == pen).all()
+
+
+@pytest.mark.parametrize("colour", [(128, 128, 128), (200, 60, 30), (230, 200, 90)])
+def test_dithering_keeps_the_average_colour(colour):
+    pens = numpy.asarray(quantize(Image.new("RGB", (100, 100), colour)))
+    shown = numpy.asarray(PALETTE)[pens].reshape(-1, 3).mean(axis=0)
+    numpy.testing.assert_allclose(shown, colour, atol=12)
+
+
+def test_only_pens_of_the_palette_are_used():
+    noise = numpy.random.default_rng(0).integers(0, 256, (60, 80, 3), dtype=numpy.uint8)
+    assert numpy.asarray(quantize(Image.fromarray(noise, "RGB"))).max() < len(PALETTE)
+
+
+@pytest.mark.parametrize("width", [70, 71])
+def test_pack_round_trip(width):
+    quantized = quantize(palette_blocks(width=width))
+    data = pack(quantized)
+    assert struct.unpack("<HH", data[4:8]) == (width, 20)
+    numpy.testing.assert_array_equal(unpack(data), numpy.asarray(quantized))
+
+
+def test_export_writes_what_the_frame_shows(tmp_path):
+    export(palette_blocks(), str(tmp_path / "screen"))
+    with open(tmp_path / "screen.bin", "rb") as f:
+        pens = unpack(f.read())
+    with Image.open(tmp_path / "screen.png") as png:
+        numpy.testing.assert_array_equal(pens, numpy.asarray(png))
+
+
+class Graphics:
+    """
+    PicoGraphics stand-in that keeps the pens drawn in a numpy framebuffer
+    """
+    def __init__(self, display=None):
+        self.framebuffer = numpy.full((480, 800), 255, numpy.uint8)
+        self.pen = 0
+        self.updates = 0
+
+    def set_pen(self, pen):
+        self.pen = pen
+
+    def clear(self):
+        self.framebuffer[:] = self.pen
+
+    def pixel_span(self, x, y, n):
+        self.framebuffer[y, x:x + n] = self.pen
+
+    def update(self):
+        self.updates += 1
+
+
+class DeflateIO(io.RawIOBase):
+    """
+    MicroPython's deflate.DeflateIO over zlib
+    """
+    def __init__(self, stream, format):
+        self.stream = stream
+        self.decompressor = zlib.decompressobj()
+        self.pending = b""
+
+    def readinto(self, buffer):
+        while len(self.pending) < len(buffer):
+            chunk = self.stream.read(256)
+            if not chunk:
+                break
+            self.pending += self.decompressor.decompress(chunk)
+        n = min(len(buffer), len(self.pending))
+        buffer[:n] = self.pending[:n]
+        self.pending = self.pending[n:]
+        return n
+
+
+@pytest.fixture
+def frame(monkeypatch):
+    """
+    inky_frame_main imported with its MicroPython modules replaced
+    """
+    modules = {name: types.ModuleType(name) for name in
+               ("micropython", "ntptime", "network", "inky_frame", "urequests", "picographics", "secrets", "deflate")}
+    modules["micropython"].native = lambda fn: fn
+    modules["picographics"].PicoGraphics = Graphics
+    modules["picographics"].DISPLAY_INKY_FRAME_7 = 7
+    modules["secrets"].WIFI_SSID = modules["secrets"].WIFI_PASSWORD = ""
+    modules["deflate"].DeflateIO = DeflateIO
+    modules["deflate"].ZLIB = 1
+    for name, module in modules.items():
+        monkeypatch.setitem(sys.modules, name, module)
+    monkeypatch.delitem(sys.modules, "inky_frame_main", raising=False)
+    return importlib.import_module("inky_frame_main")
+
+
+def test_frame_draws_the_packed_image(frame):
+    image = Image.new("RGB", (800, 480), "white")
+    image.paste(palette_blocks(width=700, height=480), (50, 0))
+    quantized = quantize(image)
+    stream = frame.BufferedStream(io.BytesIO(pack(quantized)), bytearray(frame.READ_SIZE))
+    frame.draw_packed(stream)
+    numpy.testing.assert_array_equal(frame.graphics.framebuffer, numpy.asarray(quantized))
+    assert frame.graphics.updates == 1
+
+
+def test_frame_keeps_the_image_when_the_download_is_cut_short(frame):
+    data = pack(quantize(palette_blocks(width=800, height=480)))
+    stream = frame.BufferedStream(io.BytesIO(data[:len(data) // 2]), bytearray(frame.READ_SIZE))
+    with pytest.raises(EOFError):
+        frame.draw_packed(stream)
+    assert frame.graphics.updates == 0
@@ -0,0 +1,76 @@
+import json
+import random
+
+import pytest
+
+from json_stream import batched, iter_array
+
+DOCUMENT = [
+    {"id": 1, "name": "Morning é run ☃", "distance": 1500.25, "map": {"summary_polyline": "a~l~Fjk~uOnzh@"}},
+    {"id": 2, "name": "Comma, ] and [ in a string", "distance": 12, "tags": [1, 2.5, -3e-2, None, True, False]},
+    1500.0,
+    "plain string",
+    [],
+    {},
+]
+
+
+def chunked(data: bytes, sizes) -> list[bytes]:
+    chunks = []
+    pos = 0
+    for size in sizes:
+        if pos >= len(data):
+            break
+        chunks.append(data[pos:pos + size])
+        pos += size
+    if pos < len(data):
+        chunks.append(data[pos:])
+    return chunks
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, 1 << 16])
+def test_elements_match_json_loads(chunk_size):
+    data = json.dumps(DOCUMENT, indent=1).encode()
+    assert list(iter_array(chunked(data, [chunk_size] * len(data)))) == DOCUMENT
+
+
+def test_random_chunk_boundaries():
+    data = json.dumps(DOCUMENT).encode()
+    rng = random.Random(0)
+    for _ in range(200):
+        sizes = [rng.randint(1, 12) for _ in range(len(data))]
+        assert list(iter_array(chunked(data, sizes))) == DOCUMENT
+
+
+def test_number_split_across_chunks():
+    # "1500." alone would parse as 1500
+    assert list(iter_array([b"[1500", b".", b"25]"])) == [1500.25]
+    assert list(iter_array([b"[12", b"34 ", b" ,5", b"6]"])) == [1234, 56]
+
+
+def test_multibyte_character_split_across_chunks():
+    data = json.dumps(["☃"], ensure_ascii=False).encode()
+    assert list(iter_array([data[:3], data[3:4], data[4:]])) == ["☃"]
+
+
+def test_empty_array():
+    assert list(iter_array([b" [ ", b"] "])) == []
+
+
+def test_elements_are_yielded_before_the_array_ends():
+    def chunks():
+        yield b'[{"id": 1}, '
+        raise AssertionError("read past the first element")
+
+    assert next(iter_array(chunks())) == {"id": 1}
+
+
+@pytest.mark.parametrize("data", [b'{"id": 1}', b"[1, 2", b'[{"id": 1}', b"[1 2]", b""])
+def test_invalid_documents_raise(data):
+    with pytest.raises(ValueError):
+        list(iter_array([data]))
+
+
+def test_batched():
+    assert list(batched(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(batched([], 2)) == []
@@ -0,0 +1,58 @@
+import json
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import pandas
+
+import manifest
+
+NEW_YORK = ZoneInfo("America/New_York")
+
+
+def test_quiet_window_follows_daylight_saving_time():
+    # The night the clocks go back, the window is 12 hours long
+    start, end = manifest.quiet_window(datetime(2026, 11, 1, 0, 30, tzinfo=NEW_YORK), 21, 8)
+    assert (start.hour, end.hour) == (21, 8)
+    assert end.timestamp() - start.timestamp() == 12 * 3600
+    start, end = manifest.quiet_window(datetime(2026, 10, 17, 12, tzinfo=NEW_YORK), 21, 8)
+    assert start == datetime(2026, 10, 17, 21, tzinfo=NEW_YORK)
+
+
+def test_next_wake_is_the_next_likely_upload():
+    now = datetime(2026, 10, 17, 12, tzinfo=NEW_YORK)
+    quiet = manifest.quiet_window(now, 21, 8)
+    assert manifest.next_wake(now, [7, 18], quiet, 15, 480) == datetime(2026, 10, 17, 18, 30, tzinfo=NEW_YORK)
+    # Kept within max_minutes, and out of the quiet hours
+    assert manifest.next_wake(now, [18], quiet, 15, 240) == datetime(2026, 10, 17, 16, tzinfo=NEW_YORK)
+    late = datetime(2026, 10, 17, 20, 50, tzinfo=NEW_YORK)
+    assert manifest.next_wake(late, [], quiet, 15, 240) == datetime(2026, 10, 18, 8, tzinfo=NEW_YORK)
+
+
+def test_likely_update_hours():
+    starts = pandas.to_datetime(["2026-10-01 06:10", "2026-10-02 06:20", "2026-10-03 17:40", "2025-01-01 12:00"])
+    activities = pandas.DataFrame({"start_date_local": starts, "elapsed_time": [3000.0, 3000.0, 1800.0, 600.0]})
+    assert manifest.likely_update_hours(activities, datetime(2026, 10, 17, tzinfo=NEW_YORK)) == [7, 18]
+
+
+def test_batch_athlete_manifest_points_at_their_images(strava, tmp_path):
+    from summary_screen import Strava
+
+    profile = {"name": "jane", "athlete_id": 1, "cache_dir": str(tmp_path / "jane"),
+               "output_prefix": str(tmp_path / "output" / "jane_")}
+    jane = Strava(profile=profile)
+    jane._fingerprints.record("summary", "inputs", "abc123")
+    jane.write_manifest()
+
+    with open(tmp_path / "output" / "jane_manifest.json") as f:
+        published = json.load(f)
+    assert [screen["url"] for screen in published["screens"]] == \
+        ["https://vbharath8.github.io/strava-inky/jane_combined_summary.bin"]
+    assert published["screens"][0]["hash"] == "abc123"
+
+
+def test_manifest_change_ignores_timestamps(strava):
+    strava._fingerprints.record("summary", "inputs", "abc123")
+    assert strava.write_manifest()
+    assert not strava.write_manifest()
+    strava._fingerprints.record("summary", "new inputs", "def456")
+    assert strava.write_manifest()
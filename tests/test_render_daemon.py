@@ -0,0 +1,110 @@
+import http.client
+import json
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import render_daemon
+from render_daemon import RenderDaemon, coalesce, make_handler
+
+EVENT = {"object_type": "activity", "object_id": 1, "aspect_type": "create", "owner_id": 42, "subscription_id": 7}
+
+
+class FakeStrava:
+    def __init__(self):
+        self.applied = []
+
+    def owns_event(self, event: dict) -> bool:
+        return event.get("object_type") == "activity" and event.get("owner_id") == 42
+
+    def apply_events(self, events: list[dict], sync: bool=False) -> None:
+        self.applied.append((events, sync))
+
+    def render(self, screens: list[str], force: bool=False) -> list[str]:
+        return []
+
+
+def test_coalesce_keeps_the_last_event_per_object():
+    create = {**EVENT, "aspect_type": "create"}
+    other = {**EVENT, "object_id": 2}
+    update = {**EVENT, "aspect_type": "update"}
+    assert coalesce([create, other, update]) == [other, update]
+
+
+@pytest.mark.parametrize("event, accepted", [
+    (EVENT, True),
+    ({**EVENT, "subscription_id": 8}, False),
+    ({key: value for key, value in EVENT.items() if key != "owner_id"}, False),
+    ({**EVENT, "owner_id": 43}, False),
+    ({**EVENT, "object_type": "athlete"}, False),
+])
+def test_only_own_events_of_the_subscription_are_accepted(event, accepted):
+    assert RenderDaemon(FakeStrava(), ["summary"], subscription_id=7).accepts(event) == accepted
+
+
+def test_without_a_subscription_id_every_event_is_refused():
+    assert not RenderDaemon(FakeStrava(), ["summary"], subscription_id=None).accepts(EVENT)
+
+
+def test_pending_events_are_capped(monkeypatch):
+    monkeypatch.setattr(render_daemon, "MAX_PENDING_EVENTS", 2)
+    daemon = RenderDaemon(FakeStrava(), ["summary"], subscription_id=7)
+    assert [daemon.submit(EVENT) for _ in range(3)] == [True, True, False]
+
+
+def test_only_refresh_renders_sync():
+    strava = FakeStrava()
+    daemon = RenderDaemon(strava, ["summary"], subscription_id=7)
+    daemon.render([EVENT])
+    daemon.render([])
+    assert strava.applied == [([EVENT], False), ([], True)]
+
+
+@pytest.fixture
+def webhook():
+    daemon = RenderDaemon(FakeStrava(), ["summary"], subscription_id=7)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(daemon, "token"))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield daemon, f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+    server.server_close()
+
+
+def post(url: str, body: bytes) -> int:
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=body, method="POST")) as res:
+            return res.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def test_webhook_queues_accepted_events(webhook):
+    daemon, url = webhook
+    assert post(url, json.dumps(EVENT).encode()) == 200
+    assert post(url, json.dumps({**EVENT, "subscription_id": 8}).encode()) == 403
+    assert post(url, b"[]") == 403
+    assert post(url, b"not json") == 400
+    assert daemon._events.qsize() == 1
+
+
+@pytest.mark.parametrize("length, status", [(None, 400), ("abc", 400), ("-1", 400), ("4097", 413)])
+def test_webhook_checks_the_length_before_reading(webhook, length, status):
+    _, url = webhook
+    conn = http.client.HTTPConnection(url.split("/")[2], timeout=5)
+    conn.putrequest("POST", "/")
+    if length is not None:
+        conn.putheader("Content-Length", length)
+    conn.endheaders()
+    assert conn.getresponse().status == status
+    conn.close()
+
+
+def test_webhook_validation(webhook):
+    _, url = webhook
+    with urllib.request.urlopen(f"{url}?hub.mode=subscribe&hub.verify_token=token&hub.challenge=abc") as res:
+        assert json.load(res) == {"hub.challenge": "abc"}
+    with pytest.raises(urllib.error.HTTPError):
+        urllib.request.urlopen(f"{url}?hub.mode=subscribe&hub.verify_token=wrong&hub.challenge=abc")
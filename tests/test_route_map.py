@@ -0,0 +1,93 @@
+import random
+
+import numpy
+import pytest
+
+from route_map import decode_polyline, project, route_thumbnail, simplify
+
+
+def encode(points) -> str:
+    """
+    Google's polyline encoding, as Strava's summary_polyline
+    """
+    out = []
+    previous = (0, 0)
+    for point in points:
+        current = tuple(round(value * 1e5) for value in point)
+        for value, last in zip(current, previous):
+            delta = value - last
+            delta = ~(delta << 1) if delta < 0 else delta << 1
+            while delta >= 0x20:
+                out.append(chr((0x20 | (delta & 0x1f)) + 63))
+                delta >>= 5
+            out.append(chr(delta + 63))
+        previous = current
+    return "".join(out)
+
+
+def reference_decode(encoded: str) -> list[tuple[float, float]]:
+    """
+    Character by character decoder, as in Google's documentation
+    """
+    values = []
+    value = shift = 0
+    for char in encoded:
+        chunk = ord(char) - 63
+        value |= (chunk & 0x1f) << shift
+        shift += 5
+        if chunk < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value = shift = 0
+    points = []
+    lat = lng = 0
+    for i in range(0, len(values) - 1, 2):
+        lat += values[i]
+        lng += values[i + 1]
+        points.append((lat / 1e5, lng / 1e5))
+    return points
+
+
+def test_google_reference_example():
+    decoded = decode_polyline("_p~iF~ps|U_ulLnnqC_mqNvxq`@")
+    numpy.testing.assert_allclose(decoded, [[38.5, -120.2], [40.7, -120.95], [43.252, -126.453]])
+
+
+def test_matches_the_reference_decoder_on_random_routes():
+    rng = random.Random(0)
+    for _ in range(200):
+        lat, lng = rng.uniform(-80, 80), rng.uniform(-179, 179)
+        points = []
+        for _ in range(rng.randint(1, 300)):
+            # Mostly small steps as on a route, with the odd large jump
+            step = 0.5 if rng.random() < 0.05 else 0.001
+            lat, lng = lat + rng.uniform(-step, step), lng + rng.uniform(-step, step)
+            points.append((lat, lng))
+        encoded = encode(points)
+        numpy.testing.assert_allclose(decode_polyline(encoded), reference_decode(encoded), atol=1e-9)
+
+
+def test_empty_polyline():
+    assert decode_polyline("").shape == (0, 2)
+
+
+def test_project_fits_the_size_and_keeps_the_aspect_ratio():
+    latlng = numpy.array([[0.0, 0.0], [0.0, 0.02], [0.01, 0.02]])
+    points = project(latlng, (100, 80), margin=4)
+    assert points[:, 0].min() >= 4 and points[:, 0].max() <= 96
+    assert points[:, 1].min() >= 4 and points[:, 1].max() <= 76
+    width, height = numpy.ptp(points, axis=0)
+    assert width / height == pytest.approx(2, rel=1e-3)
+
+
+def test_simplify_keeps_one_point_per_pixel():
+    points = numpy.array([[0.1, 0.1], [0.2, 0.3], [1.2, 0.4], [1.4, 0.2], [0.9, 0.1]])
+    assert simplify(points).tolist() == [[0, 0], [1, 0]]
+
+
+def test_thumbnail():
+    encoded = encode([(40.7, -74.0), (40.71, -74.0), (40.71, -73.99)])
+    image = route_thumbnail(encoded, (60, 40))
+    assert image.size == (60, 40)
+    assert image.getextrema() != ((255, 255), (255, 255), (255, 255))
+    # Too short to draw
+    assert route_thumbnail(encode([(40.7, -74.0)]), (60, 40)).getextrema() == ((255, 255), (255, 255), (255, 255))
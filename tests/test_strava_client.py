@@ -0,0 +1,52 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import tracing
+from strava_client import StravaClient
+
+BODY = b'[{"id": 1}, {"id": 2}]' * 1000
+
+
+class ChunkedHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for start in range(0, len(BODY), 4096):
+            chunk = BODY[start:start + 4096]
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ChunkedHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/activities"
+    server.shutdown()
+    server.server_close()
+
+
+def test_streamed_body_is_counted_once_read(url):
+    tracing.reset()
+    client = StravaClient(pool_size=1)
+    with client.get(url, stream=True) as res:
+        span = tracing._spans[-1]
+        headers_end = span.end_ns
+        assert span.attributes["bytes"] == 0
+        assert b"".join(res.iter_content(chunk_size=1024)) == BODY
+    assert span.attributes["bytes"] == len(BODY)
+    assert span.end_ns >= headers_end
+
+
+def test_buffered_body_is_counted(url):
+    tracing.reset()
+    StravaClient(pool_size=1).get(url)
+    assert tracing._spans[-1].attributes["bytes"] == len(BODY)
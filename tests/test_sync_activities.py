@@ -0,0 +1,38 @@
+import pytest
+import requests
+
+from fakes import FakeClient, activity_pages, make_activities
+
+
+def test_sync_fetches_every_page(strava):
+    strava.client = FakeClient({"/athlete/activities": activity_pages(make_activities(1000))})
+
+    assert strava.sync_activities(per_page=100, concurrent_pages=4) == 1000
+    assert len(strava.get_activities()) == 1000
+    assert strava.sync_activities(per_page=100) == 0
+
+
+def test_failed_page_is_fetched_again(strava):
+    activities = make_activities(1000)
+    strava.client = FakeClient({"/athlete/activities": activity_pages(activities, failing_pages={3})})
+    with pytest.raises(requests.HTTPError):
+        strava.sync_activities(per_page=100, concurrent_pages=4)
+    # Pages after the failed one were stored, but the cursor stays at the last complete round
+    assert strava._store.sync_cursor() < strava._store.last_start_date()
+
+    strava.client = FakeClient({"/athlete/activities": activity_pages(activities)})
+    strava.sync_activities(per_page=100, concurrent_pages=4)
+    assert len(strava.get_activities()) == 1000
+    assert strava._store.sync_cursor() == strava._store.last_start_date()
+
+
+def test_webhook_event_does_not_move_the_cursor(strava):
+    activities = make_activities(10)
+    strava.client = FakeClient({"/athlete/activities": activity_pages(activities[:5])})
+    strava.sync_activities()
+    # The latest activity arrives by webhook before the ones in between are synced
+    strava._store.upsert([activities[-1]])
+
+    strava.client = FakeClient({"/athlete/activities": activity_pages(activities)})
+    strava.sync_activities()
+    assert len(strava.get_activities()) == 10
@@ -0,0 +1,30 @@
+import threading
+
+import tracing
+
+
+def test_spans_nest_across_threads():
+    tracing.reset()
+    with tracing.span("render"):
+        with tracing.span("screen") as screen:
+            def draw():
+                with tracing.span("panel"):
+                    pass
+            worker = threading.Thread(target=tracing.bind(draw))
+            worker.start()
+            worker.join()
+    spans = {span.name: span for span in tracing._spans}
+    assert spans["panel"].parent_id == screen.span_id
+    assert spans["screen"].parent_id == spans["render"].span_id
+    assert set(tracing.summary()) == {"render", "screen", "panel"}
+
+
+def test_recorded_spans_are_capped(monkeypatch):
+    monkeypatch.setattr(tracing, "_spans", tracing.deque(maxlen=10))
+    for i in range(25):
+        with tracing.span("step", i=i):
+            pass
+    assert len(tracing._spans) == 10
+    assert tracing._spans[-1].attributes == {"i": 24}
+    tracing.reset()
+    assert len(tracing._spans) == 0
@@ -0,0 +1,77 @@
+import glob
+import os
+import threading
+from typing import Callable
+
+from PIL import Image
+
+import fingerprint
+import tracing
+
+_stats = {"hits": 0, "misses": 0}
+_stats_lock = threading.Lock()
+
+
+class TileCache:
+    """
+    Rendered screen panels (rings, charts, tables, quotes...) kept on disk as PNG tiles, keyed by a hash of
+    everything the panel is drawn from. Only panels whose inputs changed are drawn again, the rest are pasted
+    from their tiles. None as the directory disables the cache
+    """
+    def __init__(self, directory: str | None):
+        self._directory = directory
+
+    def get(self, panel: str, inputs: tuple, render: Callable[[], Image.Image]) -> Image.Image:
+        """
+        Returns the tile drawn by render() from the given inputs, drawing and storing it only when no tile
+        for the same inputs exists. Older tiles of the panel are removed
+        """
+        if not self._directory:
+            return render()
+
+        name = panel.replace(" ", "_")
+        path = os.path.join(self._directory, f"{name}-{fingerprint.fingerprint(panel, *inputs)[:20]}.png")
+        if os.path.exists(path):
+            try:
+                with tracing.span("tile load", panel=panel), Image.open(path) as tile:
+                    tile = tile.copy()
+                _count("hits")
+                return tile
+            except OSError:
+                pass  # Partly written tile, draw it again
+
+        _count("misses")
+        with tracing.span("tile render", panel=panel):
+            tile = render()
+        os.makedirs(self._directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        tile.save(tmp_path, format="PNG", compress_level=1)
+        os.replace(tmp_path, path)
+        for stale in glob.glob(os.path.join(self._directory, f"{name}-*.png")):
+            if stale != path:
+                os.remove(stale)
+        return tile
+
+
+    def prune(self, prefix: str, keep: set[str]) -> None:
+        """
+        Removes the tiles of panels named prefix... that are not in keep, e.g. thumbnails of activities
+        that are no longer shown
+        """
+        if not self._directory:
+            return
+        keep = {panel.replace(" ", "_") for panel in keep}
+        for path in glob.glob(os.path.join(self._directory, f"{prefix.replace(' ', '_')}*.png")):
+            if os.path.basename(path).rsplit("-", 1)[0] not in keep:
+                os.remove(path)
+
+
+def _count(key: str) -> None:
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def cache_report() -> str:
+    total = _stats["hits"] + _stats["misses"]
+    rate = f"{_stats['hits']}/{total} ({_stats['hits'] / total:.0%})" if total else "0/0"
+    return f"Tile cache hits: {rate}"
@@ -0,0 +1,158 @@
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+SERVICE_NAME = "strava-inky"
+
+# Span the current code runs under. Worker pools copy the context, so spans nest across threads
+_current_span = contextvars.ContextVar("current_span", default=None)
+# Most recent spans kept, so a process that never resets can't grow without bound. A render records a few hundred
+MAX_SPANS = 50_000
+_spans: deque["Span"] = deque(maxlen=MAX_SPANS)
+_lock = threading.Lock()
+_trace_id = os.urandom(16).hex()
+
+
+@dataclass
+class Span:
+    name: str
+    span_id: str
+    parent_id: str | None
+    start_ns: int
+    end_ns: int = 0
+    attributes: dict = field(default_factory=dict)
+
+    @property
+    def seconds(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e9
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Records the enclosed block as a span nested under the current one. Yields the span, so attributes known only
+    at the end (status, bytes) can still be added
+    """
+    parent = _current_span.get()
+    current = Span(name=name, span_id=os.urandom(8).hex(), parent_id=parent.span_id if parent else None,
+                   start_ns=time.time_ns(), attributes=attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    finally:
+        current.end_ns = time.time_ns()
+        _current_span.reset(token)
+        with _lock:
+            _spans.append(current)
+
+
+def traced(name: str):
+    """
+    Decorator recording every call of the function as a span
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record(name: str, start_ns: int, end_ns: int, **attributes) -> None:
+    """
+    Records a span measured outside of span(), e.g. module imports that happen before tracing is usable
+    """
+    parent = _current_span.get()
+    with _lock:
+        _spans.append(Span(name=name, span_id=os.urandom(8).hex(), parent_id=parent.span_id if parent else None,
+                           start_ns=start_ns, end_ns=end_ns, attributes=attributes))
+
+
+def bind(fn):
+    """
+    Wraps fn to run in a copy of the caller's context, so spans it opens on a worker thread nest correctly
+    """
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
+
+
+def reset() -> None:
+    """
+    Forgets the recorded spans, so a long-running process reports and keeps only its latest work
+    """
+    with _lock:
+        _spans.clear()
+
+
+def summary() -> dict[str, dict[str, float]]:
+    """
+    Count, total and max seconds per span name, in order of first occurrence
+    """
+    result = {}
+    with _lock:
+        spans = sorted(_spans, key=lambda s: s.start_ns)
+    for s in spans:
+        stats = result.setdefault(s.name, {"count": 0, "total_s": 0.0, "max_s": 0.0})
+        stats["count"] += 1
+        stats["total_s"] += s.seconds
+        stats["max_s"] = max(stats["max_s"], s.seconds)
+    return result
+
+
+def format_summary() -> str:
+    return "\n".join(f"  {name:<28} {stats['count']:>4}x {stats['total_s']:8.3f}s total {stats['max_s']:8.3f}s max"
+                     for name, stats in summary().items())
+
+
+def _attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def write_trace(path: str) -> None:
+    """
+    Writes every recorded span as an OpenTelemetry OTLP/JSON trace
+    """
+    with _lock:
+        spans = sorted(_spans, key=lambda s: s.start_ns)
+    trace = {
+        "resourceSpans": [{
+            "resource": {"attributes": [_attribute("service.name", SERVICE_NAME)]},
+            "scopeSpans": [{
+                "scope": {"name": SERVICE_NAME},
+                "spans": [{
+                    "traceId": _trace_id,
+                    "spanId": s.span_id,
+                    **({"parentSpanId": s.parent_id} if s.parent_id else {}),
+                    "name": s.name,
+                    "kind": 1,  # SPAN_KIND_INTERNAL
+                    "startTimeUnixNano": str(s.start_ns),
+                    "endTimeUnixNano": str(s.end_ns),
+                    "attributes": [_attribute(key, value) for key, value in s.attributes.items()],
+                } for s in spans],
+            }],
+        }],
+    }
+    _write_json(path, trace)
+
+
+def write_summary(path: str) -> None:
+    _write_json(path, summary())
+
+
+def _write_json(path: str, data) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(data, f, indent=1)